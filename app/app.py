@@ -1,10 +1,22 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from datetime import datetime
+import sqlite3
+import time
+
+import anyio
 
 from .auth.router import router as auth_router
+from .batch_router import router as batch_router
+from .compression import CompressionMiddleware
+from .debug_router import router as debug_router, slow_capture
+from .limiter import AdaptiveLimiter, ConcurrencyLimitMiddleware
+from .profiling import SlowRequestMiddleware
 from .config import settings
 from .sports_router import router as sports_router
+from .storage import storage
+from .writebehind import write_behind
 
 
 app = FastAPI(title=settings.title, version=settings.version)
@@ -18,12 +30,114 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Negotiated br/zstd/gzip for larger JSON bodies (rosters, section lists)
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=settings.compress_min_size,
+    offload_min_size=settings.compress_offload_min_size,
+    cache_entries=settings.compress_cache_entries,
+)
+
+# Opt-in cProfile capture of slow requests (SLOW_PROFILE_MS or PUT /debug/slow)
+app.add_middleware(SlowRequestMiddleware, capture=slow_capture)
+
+# Outermost: shed excess load with 503 before it reaches the threadpool
+limiter = AdaptiveLimiter(
+    initial=settings.limiter_initial,
+    max_limit=settings.limiter_max,
+    target_latency=settings.limiter_target_ms / 1000,
+    write_reserve=settings.limiter_write_reserve,
+)
+app.add_middleware(ConcurrencyLimitMiddleware, limiter=limiter)
+
+@app.on_event("startup")
+def _start_write_behind():
+    write_behind.start()
+
+@app.on_event("shutdown")
+def _stop_write_behind():
+    # Flushes whatever is still buffered
+    write_behind.stop()
+
 @app.get("/health")
 def health():
-    return {"status": "ok", "time": datetime.utcnow().isoformat()}
+    return {"status": "ok", "time": datetime.utcnow().isoformat(), "write_behind": write_behind.stats()}
+
+def _probe_db() -> dict:
+    """Time a read-only query on every DB file (sports.db and each shard),
+    and whether SQLite's write lock on sports.db can be taken within
+    READY_LOCK_TIMEOUT_MS. A lock held longer is reported as contention.
+    """
+    timeout = settings.ready_max_db_ms / 1000
+    read_ms = 0.0
+    for path in storage.paths():
+        started = time.perf_counter()
+        try:
+            conn = sqlite3.connect(f"file:{path.as_posix()}?mode=ro", uri=True, timeout=timeout)
+            try:
+                conn.execute("SELECT 1 FROM sqlite_master LIMIT 1").fetchall()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            return {"ok": False, "file": path.name, "error": str(e),
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+        read_ms = max(read_ms, (time.perf_counter() - started) * 1000)
+    # Only the primary file, with a short busy timeout: probes must not queue
+    # behind (or hold up) the writers of every shard
+    started = time.perf_counter()
+    write_lock = "free"
+    try:
+        conn = sqlite3.connect(str(storage.global_path), timeout=settings.ready_lock_timeout_ms / 1000)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.rollback()
+        finally:
+            conn.close()
+    except sqlite3.OperationalError as e:
+        if e.sqlite_errorcode != sqlite3.SQLITE_BUSY:
+            return {"ok": False, "file": storage.global_path.name, "error": str(e),
+                    "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+        write_lock = "busy"
+    except sqlite3.Error as e:
+        return {"ok": False, "file": storage.global_path.name, "error": str(e),
+                "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)}
+    return {
+        "ok": read_ms <= settings.ready_max_db_ms and write_lock == "free",
+        "read_ms": round(read_ms, 2),
+        "write_lock": write_lock,
+        "write_lock_ms": round((time.perf_counter() - started) * 1000, 2),
+        "files": len(storage.paths()),
+    }
+
+_probe_limiter = None
+
+@app.get("/ready")
+async def ready():
+    # The probe gets its own thread so a saturated default threadpool shows up
+    # in the report instead of making the probe hang.
+    global _probe_limiter
+    if _probe_limiter is None:
+        _probe_limiter = anyio.CapacityLimiter(1)
+    db = await anyio.to_thread.run_sync(_probe_db, limiter=_probe_limiter)
+    pool = anyio.to_thread.current_default_thread_limiter()
+    threadpool = {"busy": pool.borrowed_tokens, "size": int(pool.total_tokens)}
+    state = limiter.stats()
+    shedding = time.monotonic() - limiter.last_shed_at < 1.0
+    is_ready = db["ok"] and not limiter.saturated() and not shedding and threadpool["busy"] < threadpool["size"]
+    body = {
+        "status": "ready" if is_ready else "unavailable",
+        "db": db,
+        "inflight": state["inflight"],
+        "limiter": state,
+        "threadpool": threadpool,
+        "write_behind": write_behind.stats(),
+    }
+    return JSONResponse(body, status_code=200 if is_ready else 503)
 
 # Mount routers
 app.include_router(auth_router)
 app.include_router(sports_router)
+app.include_router(batch_router)
+app.include_router(debug_router)
 
 # Uvicorn entrypoint hint: `uvicorn app.app:app --reload`
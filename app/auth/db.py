@@ -1,7 +1,7 @@
 import sqlite3
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Tuple
 
 from ..passwords import hash_password
 
@@ -27,6 +27,21 @@ def init_auth_db():
             )
             """
         )
+        # Append-only revocation log: a row either revokes one token (jti) or,
+        # with jti NULL, every token of user_id issued at or before not_before
+        # (Unix time with sub-second precision, compared with the token's iat).
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS revocations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                jti TEXT,
+                user_id INTEGER NOT NULL,
+                not_before REAL,
+                expires_at INTEGER NOT NULL
+            )
+            """
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_revocations_expires ON revocations(expires_at)")
         conn.commit()
 
 def get_user_by_login(login: str) -> Optional[Dict[str, Any]]:
@@ -57,8 +72,11 @@ def create_user(login: str, password: str) -> Dict[str, Any]:
             "last_login_at": None,
         }
 
-def update_last_login(user_id: int):
-    now = datetime.utcnow().isoformat()
+def update_last_logins(batch: List[Tuple[int, str]]):
+    """Apply buffered (user_id, last_login_at) pairs in one transaction."""
     with _connect() as conn:
-        conn.execute("UPDATE users SET last_login_at = ? WHERE id = ?", (now, user_id))
+        conn.executemany(
+            "UPDATE users SET last_login_at = ? WHERE id = ? AND (last_login_at IS NULL OR last_login_at < ?)",
+            [(at, user_id, at) for user_id, at in batch],
+        )
         conn.commit()
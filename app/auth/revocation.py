@@ -0,0 +1,138 @@
+import heapq
+import threading
+import time
+from datetime import timedelta
+from typing import Optional, Dict, Any, List, Tuple
+
+from .db import _connect
+
+# Longest lifetime a session token can have ("remember me"). A user-wide
+# revocation older than this cannot match any live token and is pruned.
+MAX_SESSION_TTL = timedelta(days=30)
+
+# How often (seconds) the refresher thread picks up revocations written by other workers.
+SYNC_INTERVAL = 5.0
+
+
+class RevocationStore:
+    """In-memory mirror of the `revocations` table.
+
+    Revoked jtis live in a dict plus a min-heap ordered by expiry, so lookups
+    are O(1) and expired entries are dropped in O(log n) as time passes.
+    User-wide cutoffs are a dict user_id -> (not_before, expires_at), with
+    not_before in sub-second Unix time so a login right after "log out
+    everywhere" is not caught by it. A background thread refreshes the mirror
+    from auth.db every SYNC_INTERVAL seconds; requests never touch the DB.
+    """
+
+    def __init__(self):
+        self._jtis: Dict[str, int] = {}
+        self._heap: List[Tuple[int, str]] = []
+        self._cutoffs: Dict[int, Tuple[float, int]] = {}
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _add(self, jti: Optional[str], user_id: int, not_before: Optional[float], expires_at: int) -> None:
+        if jti:
+            if jti not in self._jtis:
+                heapq.heappush(self._heap, (expires_at, jti))
+            self._jtis[jti] = expires_at
+        elif not_before is not None:
+            prev = self._cutoffs.get(user_id)
+            if not prev or prev[0] < not_before:
+                self._cutoffs[user_id] = (not_before, expires_at)
+
+    def _prune(self, now: int) -> None:
+        with self._lock:
+            while self._heap and self._heap[0][0] < now:
+                _, jti = heapq.heappop(self._heap)
+                self._jtis.pop(jti, None)
+            stale = [uid for uid, (_, exp) in self._cutoffs.items() if exp < now]
+            for uid in stale:
+                del self._cutoffs[uid]
+
+    def sync(self) -> None:
+        """Load revocations added since the last sync (by any process)."""
+        now = int(time.time())
+        with _connect() as conn:
+            rows = conn.execute(
+                "SELECT id, jti, user_id, not_before, expires_at FROM revocations WHERE id > ? ORDER BY id",
+                (self._last_id,),
+            ).fetchall()
+        with self._lock:
+            for r in rows:
+                if r["expires_at"] >= now:
+                    self._add(r["jti"], r["user_id"], r["not_before"], r["expires_at"])
+            # Advance only past rows actually read: a row committed after this
+            # SELECT is picked up by the next sync.
+            if rows:
+                self._last_id = max(self._last_id, rows[-1]["id"])
+
+    def _run(self) -> None:
+        while not self._stop.wait(SYNC_INTERVAL):
+            try:
+                self.sync()
+            except Exception:
+                # Keep serving from the mirror if auth.db is momentarily unavailable
+                pass
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="revocation-sync", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+
+    def is_revoked(self, payload: Dict[str, Any], now: Optional[int] = None) -> bool:
+        if not self._jtis and not self._cutoffs:
+            # Nothing revoked (the usual case): no clock read, no lookups
+            return False
+        now = int(time.time()) if now is None else now
+        if self._heap and self._heap[0][0] < now:
+            self._prune(now)
+        jti = payload.get("jti")
+        if jti and jti in self._jtis:
+            return True
+        if self._cutoffs:
+            try:
+                cutoff = self._cutoffs.get(int(payload.get("sub")))
+            except Exception:
+                return False
+            if cutoff and float(payload.get("iat", 0)) <= cutoff[0]:
+                return True
+        return False
+
+    def revoke_token(self, jti: str, user_id: int, expires_at: int) -> None:
+        self._write(jti, user_id, None, expires_at)
+
+    def revoke_user(self, user_id: int) -> None:
+        """Revoke every session of user_id issued up to now."""
+        now = time.time()
+        self._write(None, user_id, now, int(now) + int(MAX_SESSION_TTL.total_seconds()))
+
+    def _write(self, jti: Optional[str], user_id: int, not_before: Optional[float], expires_at: int) -> None:
+        now = int(time.time())
+        with _connect() as conn:
+            conn.execute(
+                "INSERT INTO revocations (jti, user_id, not_before, expires_at) VALUES (?, ?, ?, ?)",
+                (jti, user_id, not_before, expires_at),
+            )
+            # Rows past their expiry can no longer match a valid token
+            conn.execute("DELETE FROM revocations WHERE expires_at < ?", (now,))
+            conn.commit()
+        with self._lock:
+            self._add(jti, user_id, not_before, expires_at)
+
+    def stats(self) -> Dict[str, int]:
+        return {"revoked_tokens": len(self._jtis), "revoked_users": len(self._cutoffs)}
+
+
+revocations = RevocationStore()
@@ -1,18 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Response
-from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException, status, Request, Response
+from datetime import datetime, timedelta
 import os
 
 from .models import RegisterRequest, LoginRequest, UserPublic
-from .db import init_auth_db, get_user_by_login, create_user, update_last_login
-from .security import create_access_token, get_current_user_optional
+from .db import init_auth_db, get_user_by_login, create_user
+from .security import create_access_token, get_current_user_optional, _decode_token
+from .revocation import revocations, MAX_SESSION_TTL
 from ..passwords import verify_password
 from ..config import settings
+from ..writebehind import write_behind
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 @router.on_event("startup")
 def on_startup():
     init_auth_db()
+    revocations.sync()
+    # Picks up revocations of other workers off the request path
+    revocations.start()
     # Seed a test teacher user for development convenience
     try:
         if not get_user_by_login("tina"):
@@ -21,6 +26,10 @@ def on_startup():
         # Non-fatal if seeding fails (e.g., concurrent startup)
         pass
 
+@router.on_event("shutdown")
+def on_shutdown():
+    revocations.stop()
+
 @router.post("/register", status_code=status.HTTP_201_CREATED)
 def register(req: RegisterRequest) -> UserPublic:
     existing = get_user_by_login(req.login)
@@ -37,7 +46,7 @@ def login(req: LoginRequest, response: Response) -> dict:
     if not verify_password(req.password, user["password_hash"]):
         raise HTTPException(status_code=401, detail="Неверные учетные данные")
 
-    expires = timedelta(days=30) if req.remember else timedelta(hours=12)
+    expires = MAX_SESSION_TTL if req.remember else timedelta(hours=12)
     token = create_access_token({"sub": str(user["id"]), "login": user["login"]}, expires_delta=expires)
 
     cookie_secure = settings.cookie_secure
@@ -54,15 +63,29 @@ def login(req: LoginRequest, response: Response) -> dict:
         path="/",
     )
 
-    update_last_login(user["id"])  # non-critical
+    # non-critical: buffered and flushed in batches by the write-behind thread
+    write_behind.record_login(user["id"], datetime.utcnow().isoformat())
 
     return {"message": "вход выполнен", "user": {"id": user["id"], "login": user["login"]}}
 
 @router.post("/logout")
-def logout(response: Response) -> dict:
+def logout(request: Request, response: Response) -> dict:
+    # Revoke the token server-side so a copied cookie stops working too
+    payload = _decode_token(request.cookies.get("tc_session") or "")
+    if payload and payload.get("jti"):
+        revocations.revoke_token(payload["jti"], int(payload["sub"]), int(payload["exp"]))
     response.delete_cookie("tc_session", path="/")
     return {"message": "выход выполнен"}
 
+@router.post("/logout-all")
+def logout_all(request: Request, response: Response) -> dict:
+    payload = _decode_token(request.cookies.get("tc_session") or "")
+    if not payload:
+        raise HTTPException(status_code=401, detail="Требуется авторизация")
+    revocations.revoke_user(int(payload["sub"]))
+    response.delete_cookie("tc_session", path="/")
+    return {"message": "все сеансы завершены"}
+
 @router.get("/me")
 def me(user = Depends(get_current_user_optional)):
     if not user:
@@ -1,12 +1,14 @@
 import os
 import hmac
 import json
+import secrets
 from datetime import datetime, timedelta, timezone
 from typing import Optional, Dict, Any
 
 from fastapi import Request
 
 from .db import get_user_by_id
+from .revocation import revocations
 
 _SECRET = os.getenv("JWT_SECRET", "dev-secret-change-me")
 
@@ -28,7 +30,10 @@ def create_access_token(payload: Dict[str, Any], expires_delta: timedelta) -> st
     now = datetime.now(timezone.utc)
     exp = now + expires_delta
     header = {"alg": "HS256", "typ": "JWT"}
-    body = {**payload, "exp": int(exp.timestamp())}
+    # jti identifies the session for revocation; iat orders it against "log out
+    # everywhere" and keeps sub-second precision so a login in the same second
+    # as the cutoff is not revoked by it
+    body = {**payload, "jti": secrets.token_urlsafe(16), "iat": now.timestamp(), "exp": int(exp.timestamp())}
     h = _b64e(json.dumps(header, separators=(",", ":")).encode("utf-8"))
     b = _b64e(json.dumps(body, separators=(",", ":")).encode("utf-8"))
     s = _sign(f"{h}.{b}".encode("ascii"))
@@ -41,7 +46,11 @@ def _decode_token(token: str) -> Optional[Dict[str, Any]]:
         if not hmac.compare_digest(sig, expected_sig):
             return None
         payload = json.loads(_b64d(b_b64))
-        if int(payload.get("exp", 0)) < int(datetime.now(timezone.utc).timestamp()):
+        now = int(datetime.now(timezone.utc).timestamp())
+        if int(payload.get("exp", 0)) < now:
+            return None
+        # In-memory check, no DB round trip on the request path
+        if revocations.is_revoked(payload, now):
             return None
         return payload
     except Exception:
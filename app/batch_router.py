@@ -0,0 +1,101 @@
+import json
+import time
+from typing import Any, Dict, List, Optional, Union
+from urllib.parse import urlencode
+
+from fastapi import APIRouter, Depends, Request
+from pydantic import BaseModel, Field
+from starlette.exceptions import HTTPException as StarletteHTTPException
+
+from .identity import require_identity
+from .sports_router import router as sports_router
+from .storage import storage
+
+# Per-batch limits
+MAX_BATCH_REQUESTS = 20
+BATCH_TIME_BUDGET = 5.0  # seconds; sub-requests not started by then are skipped
+
+router = APIRouter(prefix='/api', tags=['sports'])
+
+class SubRequest(BaseModel):
+    id: Optional[str] = None
+    path: str = Field(description='Read route under /api, e.g. /api/sections/1/students')
+    params: Dict[str, Union[str, int, float, bool]] = {}
+
+class BatchRequest(BaseModel):
+    requests: List[SubRequest] = Field(min_length=1, max_length=MAX_BATCH_REQUESTS)
+
+async def _dispatch(request: Request, identity: Dict[str, Any], sub: SubRequest) -> Dict[str, Any]:
+    """Run one GET sub-request through the sports router in-process."""
+    path, _, query = sub.path.partition('?')
+    if sub.params:
+        extra = urlencode({k: str(v).lower() if isinstance(v, bool) else v for k, v in sub.params.items()})
+        query = f"{query}&{extra}" if query else extra
+    if not path.startswith('/api/') or path.startswith('/api/batch'):
+        return {'status': 400, 'body': {'detail': 'Недопустимый путь'}}
+
+    scope = {
+        'type': 'http',
+        'asgi': request.scope.get('asgi', {'version': '3.0'}),
+        'http_version': request.scope.get('http_version', '1.1'),
+        'method': 'GET',
+        'scheme': request.scope.get('scheme', 'http'),
+        'server': request.scope.get('server'),
+        'client': request.scope.get('client'),
+        'root_path': request.scope.get('root_path', ''),
+        'path': path,
+        'raw_path': path.encode('utf-8'),
+        'query_string': query.encode('latin-1'),
+        'headers': [(k, v) for k, v in request.scope['headers'] if k not in (b'content-length', b'content-type')],
+        'app': request.scope.get('app'),
+        'state': {'identity': identity},
+    }
+    if 'starlette.exception_handlers' in request.scope:
+        scope['starlette.exception_handlers'] = request.scope['starlette.exception_handlers']
+
+    status = 500
+    chunks: List[bytes] = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+        elif message['type'] == 'http.response.body':
+            chunks.append(message.get('body', b''))
+
+    try:
+        await sports_router(scope, receive, send)
+    except StarletteHTTPException as exc:
+        # Routing errors (404/405) are raised outside the route's handlers
+        return {'status': exc.status_code, 'body': {'detail': exc.detail}}
+    raw = b''.join(chunks)
+    try:
+        body = json.loads(raw) if raw else None
+    except ValueError:
+        body = raw.decode('utf-8', 'replace')
+    return {'status': status, 'body': body}
+
+@router.post('/batch')
+async def batch(payload: BatchRequest, request: Request, identity = Depends(require_identity)):
+    """Run several read sub-requests on one connection per DB file, each in one
+    read transaction, and return all results together, with per-sub-request timing.
+    """
+    started = time.perf_counter()
+    results = []
+    with storage.snapshot():
+        for sub in payload.requests:
+            entry = {'id': sub.id, 'path': sub.path}
+            if time.perf_counter() - started > BATCH_TIME_BUDGET:
+                results.append({**entry, 'status': 503, 'elapsed_ms': 0.0,
+                                'body': {'detail': 'Превышен лимит времени пакета'}})
+                continue
+            t0 = time.perf_counter()
+            try:
+                res = await _dispatch(request, identity, sub)
+            except Exception:
+                res = {'status': 500, 'body': {'detail': 'Внутренняя ошибка'}}
+            results.append({**entry, **res, 'elapsed_ms': round((time.perf_counter() - t0) * 1000, 3)})
+    return {'results': results, 'elapsed_ms': round((time.perf_counter() - started) * 1000, 3)}
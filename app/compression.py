@@ -0,0 +1,263 @@
+import gzip
+import hashlib
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+import anyio
+
+try:  # optional: pip install brotli
+    import brotli
+except ImportError:
+    brotli = None
+
+try:  # optional: pip install zstandard
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def _gzip(body: bytes) -> bytes:
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+def _brotli(body: bytes) -> bytes:
+    return brotli.compress(body, quality=5)
+
+def _zstd(body: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=3).compress(body)
+
+# Preference order when the client accepts several with equal q
+ENCODERS: Dict[str, Callable[[bytes], bytes]] = {}
+if brotli is not None:
+    ENCODERS["br"] = _brotli
+if zstandard is not None:
+    ENCODERS["zstd"] = _zstd
+ENCODERS["gzip"] = _gzip
+
+COMPRESSIBLE_TYPES = ("application/json", "text/", "application/javascript", "image/svg+xml")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best available encoding from an Accept-Encoding header."""
+    accepted: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        token, *params = part.split(";")
+        token = token.strip().lower()
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value.strip())
+                except ValueError:
+                    q = 0.0
+        if token:
+            accepted[token] = q
+    best, best_q = None, 0.0
+    for enc in ENCODERS:
+        q = accepted.get(enc, accepted.get("*", 0.0))
+        if q > best_q:
+            best, best_q = enc, q
+    return best
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """ETag of the `encoding` representation. Validators must differ per
+    content coding (RFC 9110 8.8.3), so the coding goes inside the quotes.
+    """
+    return etag[:-1] + f'-{encoding}"' if etag.endswith('"') else etag
+
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def _strip_encoded_etags(headers: List[Tuple[bytes, bytes]], encoding: str) -> Tuple[List[Tuple[bytes, bytes]], set]:
+    """If-None-Match with our `-<encoding>` suffix removed, so handlers compare
+    against their own ETags. Also returns the stripped tags (without W/).
+    """
+    suffix = f'-{encoding}"'
+    stripped = set()
+    out = []
+    for name, value in headers:
+        if name == b"if-none-match":
+            tags = []
+            for tag in value.decode("latin-1").split(","):
+                tag = tag.strip()
+                if tag.endswith(suffix):
+                    tag = tag[:-len(suffix)] + '"'
+                    stripped.add(_opaque(tag))
+                tags.append(tag)
+            value = ", ".join(tags).encode("latin-1")
+        out.append((name, value))
+    return out, stripped
+
+
+def _with_vary(start: dict) -> dict:
+    """Response start with Accept-Encoding added to Vary."""
+    headers = []
+    vary = b"Accept-Encoding"
+    for name, value in start.get("headers", []):
+        if name == b"vary":
+            vary = value + b", " + vary
+        else:
+            headers.append((name, value))
+    headers.append((b"vary", vary))
+    return {**start, "headers": headers}
+
+
+class CompressedBodyCache:
+    """Small LRU of compressed bodies keyed by (ETag, encoding), bounded by
+    entry count and total bytes. Only touched from the event loop thread.
+    """
+
+    def __init__(self, max_entries: int, max_bytes: int):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._data: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        body = self._data.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key: Tuple[str, str], body: bytes) -> None:
+        if self.max_entries <= 0 or len(body) > self.max_bytes:
+            return
+        old = self._data.pop(key, None)
+        if old is not None:
+            self._bytes -= len(old)
+        self._data[key] = body
+        self._bytes += len(body)
+        while len(self._data) > self.max_entries or self._bytes > self.max_bytes:
+            _, evicted = self._data.popitem(last=False)
+            self._bytes -= len(evicted)
+
+
+class CompressionMiddleware:
+    """Negotiated response compression (br/zstd when installed, gzip always).
+
+    Bodies below `minimum_size` are sent as-is. Bodies of at least
+    `offload_min_size` bytes are compressed in a worker thread so the event
+    loop keeps serving other requests. Compressed bodies are cached by path,
+    query string and ETag (ETags are only unique per resource);
+    responses without one get a weak ETag derived from the body hash. The
+    ETag of a compressed body carries the coding (`"…-gzip"`); the suffix is
+    removed from If-None-Match before the app sees it and put back on its
+    304s. Streaming responses (several body chunks) pass through uncompressed.
+    Every response that could have been compressed gets Vary: Accept-Encoding.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, offload_min_size: int = 64 * 1024,
+                 cache_entries: int = 128, cache_bytes: int = 16 * 1024 * 1024):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_min_size = offload_min_size
+        self.cache = CompressedBodyCache(cache_entries, cache_bytes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept) if accept else None
+        revalidated: set = set()
+        if encoding is not None:
+            headers, revalidated = _strip_encoded_etags(scope.get("headers", []), encoding)
+            if revalidated:
+                scope = {**scope, "headers": headers}
+
+        start: Optional[dict] = None
+        passthrough = False
+
+        async def send_wrapper(message):
+            nonlocal start, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                if message.get("status") == 304 and revalidated:
+                    message = self._encoded_not_modified(message, revalidated, encoding)
+                if not self._eligible(message):
+                    passthrough = True
+                    await send(message)
+                    return
+                start = message
+                if encoding is None:
+                    passthrough = True
+                    await send(_with_vary(message))
+                return
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+            body = message.get("body", b"")
+            if message.get("more_body", False) or len(body) < self.minimum_size:
+                passthrough = True
+                await send(_with_vary(start))
+                await send(message)
+                return
+            await self._send_compressed(scope, start, body, encoding, send)
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _encoded_not_modified(start: dict, revalidated: set, encoding: str) -> dict:
+        """A 304 for a compressed representation names that representation's ETag."""
+        headers = []
+        for name, value in start.get("headers", []):
+            if name == b"etag" and _opaque(value.decode("latin-1")) in revalidated:
+                value = encoded_etag(value.decode("latin-1"), encoding).encode("latin-1")
+            headers.append((name, value))
+        return _with_vary({**start, "headers": headers})
+
+    def _eligible(self, start: dict) -> bool:
+        if start.get("status") != 200:
+            return False
+        content_type = ""
+        for name, value in start.get("headers", []):
+            if name == b"content-encoding":
+                return False
+            if name == b"content-type":
+                content_type = value.decode("latin-1").lower()
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    async def _send_compressed(self, scope, start: dict, body: bytes, encoding: str, send) -> None:
+        headers: List[Tuple[bytes, bytes]] = []
+        etag = None
+        vary = b"Accept-Encoding"
+        for name, value in start.get("headers", []):
+            if name == b"etag":
+                etag = value.decode("latin-1")
+            elif name == b"vary":
+                vary = value + b", " + vary
+            elif name != b"content-length":
+                headers.append((name, value))
+        if etag is None:
+            etag = 'W/"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+        headers.append((b"etag", encoded_etag(etag, encoding).encode("latin-1")))
+
+        key = (scope["path"], scope.get("query_string", b""), etag, encoding)
+        compressed = self.cache.get(key)
+        if compressed is None:
+            encoder = ENCODERS[encoding]
+            if len(body) >= self.offload_min_size:
+                compressed = await anyio.to_thread.run_sync(encoder, body)
+            else:
+                compressed = encoder(body)
+            self.cache.put(key, compressed)
+
+        headers.append((b"content-encoding", encoding.encode("ascii")))
+        headers.append((b"content-length", str(len(compressed)).encode("ascii")))
+        headers.append((b"vary", vary))
+        await send({**start, "headers": headers})
+        await send({"type": "http.response.body", "body": compressed})
@@ -20,4 +20,39 @@ class Settings:
     cookie_samesite: str = os.getenv("COOKIE_SAMESITE", "lax")
     cookie_domain: str | None = os.getenv("COOKIE_DOMAIN")
 
+    # Sharded sports storage: comma list of shard names, each optionally
+    # `name=/path/to/file.db` (default file: sports_<name>.db next to sports.db).
+    # Empty = everything in one sports.db.
+    sports_shards: str = os.getenv("SPORTS_SHARDS", "")
+
+    # ICS calendar feeds: rendered feeds kept in memory, assumed class length
+    ics_cache_entries: int = int(os.getenv("ICS_CACHE_ENTRIES", "1024"))
+    ics_class_minutes: int = int(os.getenv("ICS_CLASS_MINUTES", "90"))
+
+    # Recurring classes: expanded (rule, month) entries kept in memory
+    recurrence_cache_months: int = int(os.getenv("RECURRENCE_CACHE_MONTHS", "4096"))
+
+    # Response compression
+    compress_min_size: int = int(os.getenv("COMPRESS_MIN_SIZE", "1024"))
+    compress_offload_min_size: int = int(os.getenv("COMPRESS_OFFLOAD_MIN_SIZE", "65536"))
+    compress_cache_entries: int = int(os.getenv("COMPRESS_CACHE_ENTRIES", "128"))
+
+    # Write-behind buffer (last-login updates, attendance audit)
+    write_behind_max_pending: int = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+    write_behind_flush_size: int = int(os.getenv("WRITE_BEHIND_FLUSH_SIZE", "500"))
+    write_behind_flush_interval: float = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "2.0"))
+
+    # Adaptive concurrency limit / readiness
+    limiter_initial: int = int(os.getenv("LIMITER_INITIAL", "32"))
+    limiter_max: int = int(os.getenv("LIMITER_MAX", "256"))
+    limiter_target_ms: float = float(os.getenv("LIMITER_TARGET_MS", "250"))
+    limiter_write_reserve: float = float(os.getenv("LIMITER_WRITE_RESERVE", "0.2"))
+    ready_max_db_ms: float = float(os.getenv("READY_MAX_DB_MS", "500"))
+    ready_lock_timeout_ms: float = float(os.getenv("READY_LOCK_TIMEOUT_MS", "50"))
+
+    # Slow-request cProfile capture (0 = off)
+    slow_profile_ms: float = float(os.getenv("SLOW_PROFILE_MS", "0"))
+    slow_profile_sample: float = float(os.getenv("SLOW_PROFILE_SAMPLE", "1.0"))
+    slow_profile_keep: int = int(os.getenv("SLOW_PROFILE_KEEP", "20"))
+
 settings = Settings()
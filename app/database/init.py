@@ -57,3 +57,115 @@ def seed_db(db_path="sports.db", seed_path="seed.sql"):
         print(f"Database seeded at {db_file} using {seed_file}")
     finally:
         conn.close()
+
+# Columns added after databases were first created; CREATE TABLE IF NOT EXISTS
+# in init.sql does not add them to existing tables.
+_ADDED_COLUMNS = [
+    ("sections", "capacity", "INTEGER CHECK(capacity IS NULL OR capacity >= 0)"),
+    ("sections", "member_count", "INTEGER NOT NULL DEFAULT 0"),
+    ("sections", "faculty", "TEXT"),
+    ("classes", "schedule_id", "INTEGER"),
+]
+
+# Indexes on added columns: created after the columns exist
+_ADDED_INDEXES = [
+    # One stored session per rule and start (see section_schedules in init.sql)
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_classes_schedule ON classes(schedule_id, date) "
+    "WHERE schedule_id IS NOT NULL",
+]
+
+# Triggers whose definition changed: (name, text the current definition
+# contains). An older version is dropped so init.sql re-creates it.
+_CHANGED_TRIGGERS = [
+    ("trg_feed_classes_ins", "schedule_id"),
+    ("trg_feed_classes_upd", "schedule_id"),
+    ("trg_feed_classes_del", "schedule_id"),
+]
+
+# calendar_bits kinds changed from 'scheduled' to one per membership role:
+# an older table (and the view and triggers writing it) is rebuilt
+_CALENDAR_MARKER = "scheduled_student"
+
+# init.sql is split at this line: global tables above, section-scoped tables
+# below (sharded storage applies each part to its own files).
+SHARD_MARKER = "-- @shard"
+
+def schema_part(sql, part="all"):
+    """`part` of init.sql: "all", "global" (above the marker) or "shard"."""
+    if part == "all":
+        return sql
+    head, found, tail = sql.partition(SHARD_MARKER)
+    if not found:
+        raise ValueError(f"Schema has no {SHARD_MARKER!r} marker")
+    return head if part == "global" else tail
+
+def migrate_db(db_path="sports.db", schema_path="init.sql", part="all"):
+    """Bring an existing DB up to the current schema. Idempotent: re-applies
+    init.sql (all IF NOT EXISTS), adds missing columns and backfills them.
+    Also switches the DB to WAL so readers don't block the writer.
+    `part` limits it to the global or shard part of the schema (see schema_part).
+    """
+    data_dir = Path(__file__).resolve().parent.parent / 'data'
+    schema_dir = Path(__file__).resolve().parent  # app/database
+
+    db_file = Path(db_path)
+    if not db_file.is_absolute():
+        db_file = data_dir / db_file
+
+    schema_file = Path(schema_path)
+    if not schema_file.is_absolute():
+        schema_file = schema_dir / schema_file
+
+    conn = sqlite3.connect(str(db_file))
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        had_calendar = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'calendar_bits'"
+        ).fetchone()
+        if had_calendar and _CALENDAR_MARKER not in had_calendar[0]:
+            for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg\\_calendar\\_%' ESCAPE '\\'"
+            ).fetchall():
+                conn.execute(f"DROP TRIGGER {name}")
+            conn.execute("DROP VIEW IF EXISTS calendar_days")
+            conn.execute("DROP TABLE calendar_bits")
+            had_calendar = None
+        had_versions = conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'calendar_versions'"
+        ).fetchone()
+        for name, marker in _CHANGED_TRIGGERS:
+            row = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = ?", (name,)).fetchone()
+            if row and marker not in row[0]:
+                conn.execute(f"DROP TRIGGER {name}")
+        conn.executescript(schema_part(schema_file.read_text(encoding="utf-8"), part))
+        added = set()
+        for table, column, decl in _ADDED_COLUMNS:
+            cols = {r[1] for r in conn.execute(f"PRAGMA table_info({table})")}
+            # no cols: the table is not part of this DB (global part of a sharded layout)
+            if cols and column not in cols:
+                conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
+                added.add((table, column))
+        if part != "global":
+            for sql in _ADDED_INDEXES:
+                conn.execute(sql)
+        if ("sections", "member_count") in added:
+            conn.execute(
+                "UPDATE sections SET member_count = "
+                "(SELECT COUNT(1) FROM section_members m WHERE m.section_id = sections.id AND m.role = 'student')"
+            )
+        if not had_calendar and part != "global":
+            # Rows written before the calendar triggers existed: build the bitmaps once
+            conn.execute(
+                "INSERT OR REPLACE INTO calendar_bits (user_id, month, kind, bits) "
+                "SELECT user_id, month, kind, SUM(DISTINCT day_bit) FROM calendar_days "
+                "GROUP BY user_id, month, kind"
+            )
+        if not had_versions and part != "global":
+            # Give existing members a feed version (and so a Last-Modified)
+            conn.execute(
+                "INSERT OR IGNORE INTO calendar_versions (user_id, version, changed_at) "
+                "SELECT DISTINCT user_id, 1, CURRENT_TIMESTAMP FROM section_members"
+            )
+        conn.commit()
+    finally:
+        conn.close()
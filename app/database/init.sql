@@ -6,11 +6,48 @@ CREATE TABLE IF NOT EXISTS users (
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Mapping between auth service login and sports users (app-layer linkage)
+CREATE TABLE IF NOT EXISTS auth_links (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    auth_login TEXT NOT NULL UNIQUE,
+    sports_user_id INTEGER NOT NULL,
+    FOREIGN KEY (sports_user_id) REFERENCES users(id)
+);
+
+-- Append-only history of attendance changes (written in batches by the write-behind buffer)
+CREATE TABLE IF NOT EXISTS attendance_audit (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    class_id INTEGER NOT NULL,
+    student_id INTEGER NOT NULL,
+    old_status TEXT, -- NULL: no mark before
+    new_status TEXT, -- NULL: mark removed
+    notes TEXT,
+    changed_by INTEGER, -- sports user id of the teacher
+    changed_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_attendance_audit_mark ON attendance_audit(class_id, student_id);
+
+-- Sharded storage only: the shard file holding each section and everything
+-- under it (classes, members, waitlist, attendance). See app/storage.py.
+CREATE TABLE IF NOT EXISTS section_shards (
+    section_id INTEGER PRIMARY KEY,
+    shard TEXT NOT NULL
+);
+
+-- @shard
+-- Section-scoped tables. A single-file sports.db holds everything; sharded
+-- storage keeps what is above this marker in sports.db and one copy of what
+-- is below it in every shard file.
+
 CREATE TABLE IF NOT EXISTS sections (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     name TEXT NOT NULL UNIQUE,
     description TEXT,
-    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    capacity INTEGER CHECK(capacity IS NULL OR capacity >= 0), -- NULL = unlimited
+    member_count INTEGER NOT NULL DEFAULT 0, -- students enrolled; maintained by triggers below
+    faculty TEXT -- shard placement key; sections of one faculty share a shard
 );
 
 CREATE TABLE IF NOT EXISTS classes (
@@ -18,6 +55,7 @@ CREATE TABLE IF NOT EXISTS classes (
     section_id INTEGER NOT NULL,
     date DATETIME NOT NULL,
     location TEXT,
+    schedule_id INTEGER, -- section_schedules rule this session was created from; NULL = one-off class
     FOREIGN KEY (section_id) REFERENCES sections(id)
 );
 
@@ -31,6 +69,32 @@ CREATE TABLE IF NOT EXISTS section_members (
     UNIQUE(section_id, user_id)
 );
 
+-- Keep sections.member_count in step with student memberships
+CREATE TRIGGER IF NOT EXISTS trg_section_members_count_ins
+AFTER INSERT ON section_members WHEN NEW.role = 'student'
+BEGIN
+    UPDATE sections SET member_count = member_count + 1 WHERE id = NEW.section_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_section_members_count_del
+AFTER DELETE ON section_members WHEN OLD.role = 'student'
+BEGIN
+    UPDATE sections SET member_count = member_count - 1 WHERE id = OLD.section_id;
+END;
+
+-- Students waiting for a place in a full section; served in id order
+CREATE TABLE IF NOT EXISTS section_waitlist (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    section_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (section_id) REFERENCES sections(id),
+    FOREIGN KEY (user_id) REFERENCES users(id),
+    UNIQUE(section_id, user_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_section_waitlist_order ON section_waitlist(section_id, id);
+
 CREATE TABLE IF NOT EXISTS attendance (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
     class_id INTEGER NOT NULL,
@@ -52,10 +116,319 @@ CREATE TABLE IF NOT EXISTS section_permissions (
     UNIQUE(section_id, user_id, permission)
 );
 
--- Mapping between auth service login and sports users (app-layer linkage)
-CREATE TABLE IF NOT EXISTS auth_links (
+-- Lookups by user (calendar maintenance, "my sections")
+CREATE INDEX IF NOT EXISTS idx_section_members_user ON section_members(user_id, role);
+CREATE INDEX IF NOT EXISTS idx_classes_section_date ON classes(section_id, date);
+CREATE INDEX IF NOT EXISTS idx_attendance_student ON attendance(student_id);
+
+-- Per-user month calendar as bitmaps: bit (d - 1) of `bits` is set when the
+-- user has something of `kind` on day d. Maintained by the triggers below,
+-- so a month is one row read instead of a DISTINCT date() scan over joins.
+-- Class days are kept per membership role (scheduled_student/_teacher): a
+-- user can teach one section and attend another.
+CREATE TABLE IF NOT EXISTS calendar_bits (
+    user_id INTEGER NOT NULL,
+    month TEXT NOT NULL, -- YYYY-MM
+    kind TEXT NOT NULL CHECK(kind IN ('scheduled_student', 'scheduled_teacher', 'present', 'absent', 'late')),
+    bits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, month, kind)
+) WITHOUT ROWID;
+
+-- Source of truth the bitmaps are recomputed from (one row per user/day/kind)
+CREATE VIEW IF NOT EXISTS calendar_days AS
+SELECT m.user_id AS user_id,
+       strftime('%Y-%m', c.date) AS month,
+       'scheduled_' || m.role AS kind,
+       1 << (CAST(strftime('%d', c.date) AS INTEGER) - 1) AS day_bit
+FROM section_members m
+JOIN classes c ON c.section_id = m.section_id
+UNION ALL
+SELECT a.student_id,
+       strftime('%Y-%m', c.date),
+       a.status,
+       1 << (CAST(strftime('%d', c.date) AS INTEGER) - 1)
+FROM attendance a
+JOIN classes c ON c.id = a.class_id;
+
+-- Each trigger recomputes only the (user, month, kind) rows its change can
+-- affect. SUM(DISTINCT day_bit) is a bitwise OR of distinct powers of two.
+CREATE TRIGGER IF NOT EXISTS trg_calendar_members_ins
+AFTER INSERT ON section_members
+BEGIN
+    INSERT INTO calendar_bits (user_id, month, kind, bits)
+    SELECT NEW.user_id, k.month, 'scheduled_' || NEW.role,
+           (SELECT IFNULL(SUM(DISTINCT d.day_bit), 0) FROM calendar_days d
+            WHERE d.user_id = NEW.user_id AND d.month = k.month AND d.kind = 'scheduled_' || NEW.role)
+    FROM (SELECT DISTINCT strftime('%Y-%m', date) AS month FROM classes WHERE section_id = NEW.section_id) k
+    WHERE true
+    ON CONFLICT(user_id, month, kind) DO UPDATE SET bits = excluded.bits;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_calendar_members_del
+AFTER DELETE ON section_members
+BEGIN
+    INSERT INTO calendar_bits (user_id, month, kind, bits)
+    SELECT OLD.user_id, k.month, 'scheduled_' || OLD.role,
+           (SELECT IFNULL(SUM(DISTINCT d.day_bit), 0) FROM calendar_days d
+            WHERE d.user_id = OLD.user_id AND d.month = k.month AND d.kind = 'scheduled_' || OLD.role)
+    FROM (SELECT DISTINCT strftime('%Y-%m', date) AS month FROM classes WHERE section_id = OLD.section_id) k
+    WHERE true
+    ON CONFLICT(user_id, month, kind) DO UPDATE SET bits = excluded.bits;
+END;
+
+-- A changed role, user or section moves the membership: recompute the rows
+-- of the old and the new (user, kind) for the months of both sections
+CREATE TRIGGER IF NOT EXISTS trg_calendar_members_upd
+AFTER UPDATE OF section_id, user_id, role ON section_members
+BEGIN
+    INSERT INTO calendar_bits (user_id, month, kind, bits)
+    SELECT k.user_id, k.month, k.kind,
+           (SELECT IFNULL(SUM(DISTINCT d.day_bit), 0) FROM calendar_days d
+            WHERE d.user_id = k.user_id AND d.month = k.month AND d.kind = k.kind)
+    FROM (
+        SELECT OLD.user_id AS user_id, strftime('%Y-%m', date) AS month, 'scheduled_' || OLD.role AS kind
+        FROM classes WHERE section_id = OLD.section_id
+        UNION
+        SELECT NEW.user_id, strftime('%Y-%m', date), 'scheduled_' || NEW.role
+        FROM classes WHERE section_id = NEW.section_id
+    ) k
+    WHERE true
+    ON CONFLICT(user_id, month, kind) DO UPDATE SET bits = excluded.bits;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_calendar_classes_ins
+AFTER INSERT ON classes
+BEGIN
+    INSERT INTO calendar_bits (user_id, month, kind, bits)
+    SELECT m.user_id, strftime('%Y-%m', NEW.date), 'scheduled_' || m.role,
+           (SELECT IFNULL(SUM(DISTINCT d.day_bit), 0) FROM calendar_days d
+            WHERE d.user_id = m.user_id AND d.month = strftime('%Y-%m', NEW.date) AND d.kind = 'scheduled_' || m.role)
+    FROM section_members m
+    WHERE m.section_id = NEW.section_id
+    ON CONFLICT(user_id, month, kind) DO UPDATE SET bits = excluded.bits;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_calendar_classes_upd
+AFTER UPDATE OF section_id, date ON classes
+BEGIN
+    INSERT INTO calendar_bits (user_id, month, kind, bits)
+    SELECT k.user_id, k.month, k.kind,
+           (SELECT IFNULL(SUM(DISTINCT d.day_bit), 0) FROM calendar_days d
+            WHERE d.user_id = k.user_id AND d.month = k.month AND d.kind = k.kind)
+    FROM (
+        SELECT user_id, strftime('%Y-%m', OLD.date) AS month, 'scheduled_' || role AS kind
+        FROM section_members WHERE section_id = OLD.section_id
+        UNION
+        SELECT user_id, strftime('%Y-%m', NEW.date), 'scheduled_' || role
+        FROM section_members WHERE section_id = NEW.section_id
+        UNION
+        SELECT a.student_id, mo.month, s.kind
+        FROM attendance a
+        JOIN (SELECT strftime('%Y-%m', OLD.date) AS month UNION SELECT strftime('%Y-%m', NEW.date)) mo
+        JOIN (SELECT 'present' AS kind UNION ALL SELECT 'absent' UNION ALL SELECT 'late') s
+        WHERE a.class_id = NEW.id
+    ) k
+    WHERE true
+    ON CONFLICT(user_id, month, kind) DO UPDATE SET bits = excluded.bits;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_calendar_classes_del
+AFTER DELETE ON classes
+BEGIN
+    INSERT INTO calendar_bits (user_id, month, kind, bits)
+    SELECT k.user_id, strftime('%Y-%m', OLD.date), k.kind,
+           (SELECT IFNULL(SUM(DISTINCT d.day_bit), 0) FROM calendar_days d
+            WHERE d.user_id = k.user_id AND d.month = strftime('%Y-%m', OLD.date) AND d.kind = k.kind)
+    FROM (
+        SELECT user_id, 'scheduled_' || role AS kind FROM section_members WHERE section_id = OLD.section_id
+        UNION
+        SELECT a.student_id, s.kind
+        FROM attendance a
+        JOIN (SELECT 'present' AS kind UNION ALL SELECT 'absent' UNION ALL SELECT 'late') s
+        WHERE a.class_id = OLD.id
+    ) k
+    WHERE true
+    ON CONFLICT(user_id, month, kind) DO UPDATE SET bits = excluded.bits;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_calendar_attendance_ins
+AFTER INSERT ON attendance
+BEGIN
+    INSERT INTO calendar_bits (user_id, month, kind, bits)
+    SELECT NEW.student_id, strftime('%Y-%m', c.date), NEW.status,
+           (SELECT IFNULL(SUM(DISTINCT d.day_bit), 0) FROM calendar_days d
+            WHERE d.user_id = NEW.student_id AND d.month = strftime('%Y-%m', c.date) AND d.kind = NEW.status)
+    FROM classes c
+    WHERE c.id = NEW.class_id
+    ON CONFLICT(user_id, month, kind) DO UPDATE SET bits = excluded.bits;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_calendar_attendance_upd
+AFTER UPDATE OF status, class_id, student_id ON attendance
+BEGIN
+    INSERT INTO calendar_bits (user_id, month, kind, bits)
+    SELECT k.user_id, k.month, k.kind,
+           (SELECT IFNULL(SUM(DISTINCT d.day_bit), 0) FROM calendar_days d
+            WHERE d.user_id = k.user_id AND d.month = k.month AND d.kind = k.kind)
+    FROM (
+        SELECT OLD.student_id AS user_id, strftime('%Y-%m', c.date) AS month, OLD.status AS kind
+        FROM classes c WHERE c.id = OLD.class_id
+        UNION
+        SELECT NEW.student_id, strftime('%Y-%m', c.date), NEW.status
+        FROM classes c WHERE c.id = NEW.class_id
+    ) k
+    WHERE true
+    ON CONFLICT(user_id, month, kind) DO UPDATE SET bits = excluded.bits;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_calendar_attendance_del
+AFTER DELETE ON attendance
+BEGIN
+    INSERT INTO calendar_bits (user_id, month, kind, bits)
+    SELECT OLD.student_id, strftime('%Y-%m', c.date), OLD.status,
+           (SELECT IFNULL(SUM(DISTINCT d.day_bit), 0) FROM calendar_days d
+            WHERE d.user_id = OLD.student_id AND d.month = strftime('%Y-%m', c.date) AND d.kind = OLD.status)
+    FROM classes c
+    WHERE c.id = OLD.class_id
+    ON CONFLICT(user_id, month, kind) DO UPDATE SET bits = excluded.bits;
+END;
+
+-- Per-user version of the ICS feed (app/ics.py): bumped by the triggers below
+-- whenever one of the user's memberships, or a class or the name of one of
+-- their sections, changes. Feeds are regenerated only when it moves.
+CREATE TABLE IF NOT EXISTS calendar_versions (
+    user_id INTEGER PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0,
+    changed_at TEXT NOT NULL -- UTC, YYYY-MM-DD HH:MM:SS
+);
+
+-- Random per database file, part of every feed ETag: versions restart at 1
+-- when a DB is recreated, and old ETags must not match the new feeds.
+CREATE TABLE IF NOT EXISTS calendar_epoch (
+    id INTEGER PRIMARY KEY CHECK(id = 1),
+    epoch TEXT NOT NULL
+);
+INSERT OR IGNORE INTO calendar_epoch (id, epoch) VALUES (1, lower(hex(randomblob(8))));
+
+CREATE TRIGGER IF NOT EXISTS trg_feed_members_ins
+AFTER INSERT ON section_members
+BEGIN
+    INSERT INTO calendar_versions (user_id, version, changed_at) VALUES (NEW.user_id, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT(user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_feed_members_del
+AFTER DELETE ON section_members
+BEGIN
+    INSERT INTO calendar_versions (user_id, version, changed_at) VALUES (OLD.user_id, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT(user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+-- Stored sessions of an existing rule are not feed events (the rule's RRULE
+-- covers them), so recording attendance does not move members' versions.
+CREATE TRIGGER IF NOT EXISTS trg_feed_classes_ins
+AFTER INSERT ON classes
+WHEN NEW.schedule_id IS NULL OR NOT EXISTS (SELECT 1 FROM section_schedules WHERE id = NEW.schedule_id)
+BEGIN
+    INSERT INTO calendar_versions (user_id, version, changed_at)
+    SELECT user_id, 1, CURRENT_TIMESTAMP FROM section_members WHERE section_id = NEW.section_id
+    ON CONFLICT(user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_feed_classes_upd
+AFTER UPDATE OF section_id, date, location, schedule_id ON classes
+WHEN OLD.schedule_id IS NULL OR NOT EXISTS (SELECT 1 FROM section_schedules WHERE id = OLD.schedule_id)
+  OR NEW.schedule_id IS NULL OR NOT EXISTS (SELECT 1 FROM section_schedules WHERE id = NEW.schedule_id)
+BEGIN
+    INSERT INTO calendar_versions (user_id, version, changed_at)
+    SELECT user_id, 1, CURRENT_TIMESTAMP FROM section_members
+    WHERE section_id IN (OLD.section_id, NEW.section_id)
+    ON CONFLICT(user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_feed_classes_del
+AFTER DELETE ON classes
+WHEN OLD.schedule_id IS NULL OR NOT EXISTS (SELECT 1 FROM section_schedules WHERE id = OLD.schedule_id)
+BEGIN
+    INSERT INTO calendar_versions (user_id, version, changed_at)
+    SELECT user_id, 1, CURRENT_TIMESTAMP FROM section_members WHERE section_id = OLD.section_id
+    ON CONFLICT(user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_feed_sections_upd
+AFTER UPDATE OF name ON sections
+BEGIN
+    INSERT INTO calendar_versions (user_id, version, changed_at)
+    SELECT user_id, 1, CURRENT_TIMESTAMP FROM section_members WHERE section_id = NEW.id
+    ON CONFLICT(user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+-- Weekly class rules. Their sessions are not rows of `classes`: the API
+-- expands them per month when read (app/recurrence.py) and a session gets
+-- its classes row (classes.schedule_id) only when attendance is recorded.
+CREATE TABLE IF NOT EXISTS section_schedules (
     id INTEGER PRIMARY KEY AUTOINCREMENT,
-    auth_login TEXT NOT NULL UNIQUE,
-    sports_user_id INTEGER NOT NULL,
-    FOREIGN KEY (sports_user_id) REFERENCES users(id)
+    section_id INTEGER NOT NULL,
+    weekdays INTEGER NOT NULL CHECK(weekdays BETWEEN 1 AND 127), -- bit 0 = Monday ... bit 6 = Sunday
+    start_time TEXT NOT NULL CHECK(start_time GLOB '[01][0-9]:[0-5][0-9]' OR start_time GLOB '2[0-3]:[0-5][0-9]'), -- HH:MM, wall-clock time at the venue
+    location TEXT,
+    starts_on TEXT NOT NULL, -- YYYY-MM-DD, first day of the term
+    ends_on TEXT NOT NULL, -- YYYY-MM-DD, last day of the term (inclusive)
+    revision INTEGER NOT NULL DEFAULT 0, -- bumped by the triggers below; keys the expansion cache
+    FOREIGN KEY (section_id) REFERENCES sections(id),
+    CHECK(starts_on <= ends_on)
 );
+
+-- Days a rule does not meet (holidays, cancelled sessions)
+CREATE TABLE IF NOT EXISTS section_schedule_exceptions (
+    schedule_id INTEGER NOT NULL,
+    date TEXT NOT NULL, -- YYYY-MM-DD
+    PRIMARY KEY (schedule_id, date),
+    FOREIGN KEY (schedule_id) REFERENCES section_schedules(id)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS idx_section_schedules_section ON section_schedules(section_id, ends_on);
+
+CREATE TRIGGER IF NOT EXISTS trg_schedules_revision_upd
+AFTER UPDATE OF section_id, weekdays, start_time, location, starts_on, ends_on ON section_schedules
+BEGIN
+    UPDATE section_schedules SET revision = revision + 1 WHERE id = NEW.id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_schedule_exceptions_ins
+AFTER INSERT ON section_schedule_exceptions
+BEGIN
+    UPDATE section_schedules SET revision = revision + 1 WHERE id = NEW.schedule_id;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_schedule_exceptions_del
+AFTER DELETE ON section_schedule_exceptions
+BEGIN
+    UPDATE section_schedules SET revision = revision + 1 WHERE id = OLD.schedule_id;
+END;
+
+-- Feed versions follow the rules too (every change above ends in a revision bump)
+CREATE TRIGGER IF NOT EXISTS trg_feed_schedules_ins
+AFTER INSERT ON section_schedules
+BEGIN
+    INSERT INTO calendar_versions (user_id, version, changed_at)
+    SELECT user_id, 1, CURRENT_TIMESTAMP FROM section_members WHERE section_id = NEW.section_id
+    ON CONFLICT(user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_feed_schedules_upd
+AFTER UPDATE OF revision ON section_schedules
+BEGIN
+    INSERT INTO calendar_versions (user_id, version, changed_at)
+    SELECT user_id, 1, CURRENT_TIMESTAMP FROM section_members
+    WHERE section_id IN (OLD.section_id, NEW.section_id)
+    ON CONFLICT(user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
+
+CREATE TRIGGER IF NOT EXISTS trg_feed_schedules_del
+AFTER DELETE ON section_schedules
+BEGIN
+    INSERT INTO calendar_versions (user_id, version, changed_at)
+    SELECT user_id, 1, CURRENT_TIMESTAMP FROM section_members WHERE section_id = OLD.section_id
+    ON CONFLICT(user_id) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+END;
@@ -9,10 +9,13 @@ BEGIN TRANSACTION;
 
 -- Очистка данных (важен порядок из‑за внешних ключей)
 DELETE FROM attendance;
+DELETE FROM section_waitlist;
 DELETE FROM section_permissions;
 DELETE FROM auth_links;
 DELETE FROM section_members;
 DELETE FROM classes;
+DELETE FROM section_schedule_exceptions;
+DELETE FROM section_schedules;
 DELETE FROM sections;
 DELETE FROM users;
 
@@ -27,10 +30,11 @@ INSERT INTO users (id, full_name, email, role, created_at) VALUES
   (5, 'Валентина Петрова', 'tina@edu.susu.ru', 'teacher', CURRENT_TIMESTAMP);
 
 -- Секции
-INSERT INTO sections (id, name, description, created_at) VALUES
-  (1, 'Баскетбол', 'Тренировки и участие в соревнованиях в сборной ЮУрГУ по баскетболу', CURRENT_TIMESTAMP),
-  (2, 'Настольный теннис', 'Игра в настольный теннис между участниками секции', CURRENT_TIMESTAMP),
-  (3, 'Дартс', 'Секция по дартсу', CURRENT_TIMESTAMP);
+-- capacity: NULL = без ограничения
+INSERT INTO sections (id, name, description, created_at, capacity) VALUES
+  (1, 'Баскетбол', 'Тренировки и участие в соревнованиях в сборной ЮУрГУ по баскетболу', CURRENT_TIMESTAMP, 30),
+  (2, 'Настольный теннис', 'Игра в настольный теннис между участниками секции', CURRENT_TIMESTAMP, 16),
+  (3, 'Дартс', 'Секция по дартсу', CURRENT_TIMESTAMP, NULL);
 
 -- Занятия внутри секций (ISO-8601 дата/время)
 INSERT INTO classes (id, section_id, date, location) VALUES
@@ -40,6 +44,18 @@ INSERT INTO classes (id, section_id, date, location) VALUES
   (4, 2, '2025-08-14 17:00:00', 'Поле 2'),
   (5, 3, '2025-08-15 18:00:00', 'Место секции дартса');
 
+-- Расписание на осенний семестр: занятия разворачиваются из правил,
+-- строка в classes появляется только после отметки посещаемости.
+-- weekdays: бит 0 = понедельник ... бит 6 = воскресенье
+INSERT INTO section_schedules (id, section_id, weekdays, start_time, location, starts_on, ends_on) VALUES
+  (1, 1, 5, '16:00', 'Зал А', '2025-09-01', '2025-12-27'),   -- пн, ср
+  (2, 2, 10, '17:00', 'Поле 1', '2025-09-01', '2025-12-27'), -- вт, чт
+  (3, 3, 16, '18:00', 'Место секции дартса', '2025-09-01', '2025-12-27'); -- пт
+
+-- Дни без занятий (праздники)
+INSERT INTO section_schedule_exceptions (schedule_id, date) VALUES
+  (2, '2025-11-04');
+
 -- Участники секций (студенты + преподаватели)
 -- Баскетбол: преподаватель Тина (5), студенты: Иван (1), Мария (2), Даниил (3)
 INSERT INTO section_members (id, section_id, user_id, role) VALUES
@@ -0,0 +1,69 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, Response
+
+from .identity import get_identity, require_identity
+from .profiling import collapsed, run_on_own_thread, sample_stacks, SlowRequestCapture
+from .config import settings
+
+def require_admin(identity = Depends(require_identity)):
+    if identity['role'] != 'admin':
+        raise HTTPException(status_code=403, detail='Только для администратора')
+    return identity
+
+# Admin check per route: /profile does it without the threadpool
+router = APIRouter(prefix='/debug', tags=['debug'])
+
+slow_capture = SlowRequestCapture(
+    threshold_ms=settings.slow_profile_ms,
+    sample=settings.slow_profile_sample,
+    keep=settings.slow_profile_keep,
+)
+
+@router.get('/profile', response_class=PlainTextResponse)
+async def profile(
+    request: Request,
+    seconds: float = Query(5, gt=0, le=60),
+    interval_ms: float = Query(5, ge=1, le=100),
+):
+    """Sample all threads (including AnyIO workers running handlers) for
+    `seconds` and return collapsed stacks, ready for flamegraph.pl/speedscope.
+    Async, with the admin check and the sampling on threads of their own, so
+    it works while every threadpool slot is busy.
+    """
+    identity = await run_on_own_thread(get_identity, request)
+    require_admin(require_identity(identity))
+    stacks = await run_on_own_thread(sample_stacks, seconds, interval_ms / 1000)
+    if stacks is None:
+        raise HTTPException(status_code=409, detail='Профилирование уже выполняется')
+    return PlainTextResponse(collapsed(stacks))
+
+@router.get('/slow', dependencies=[Depends(require_admin)])
+def slow_list():
+    """Captured slow-request traces (newest last) and the capture settings."""
+    return {
+        'threshold_ms': slow_capture.threshold_ms,
+        'sample': slow_capture.sample,
+        'entries': slow_capture.list(),
+    }
+
+@router.put('/slow', dependencies=[Depends(require_admin)])
+def slow_configure(
+    threshold_ms: float = Query(..., ge=0, description='0 disables capture'),
+    sample: float = Query(1.0, gt=0, le=1),
+):
+    slow_capture.configure(threshold_ms, sample)
+    return {'threshold_ms': slow_capture.threshold_ms, 'sample': slow_capture.sample}
+
+@router.get('/slow/{entry_id}', dependencies=[Depends(require_admin)])
+def slow_entry(entry_id: int, format: str = Query('text', pattern='^(text|prof)$')):
+    """A captured trace: pstats text report, or the raw .prof for pstats/snakeviz."""
+    entry = slow_capture.get(entry_id)
+    if not entry:
+        raise HTTPException(status_code=404, detail='Запись не найдена')
+    if format == 'prof':
+        return Response(
+            entry['prof'],
+            media_type='application/octet-stream',
+            headers={'Content-Disposition': f'attachment; filename="slow-{entry_id}.prof"'},
+        )
+    return PlainTextResponse(f"{entry['method']} {entry['path']} {entry['elapsed_ms']} ms\n\n{entry['report']}")
@@ -0,0 +1,185 @@
+import hashlib
+import hmac
+import threading
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta, timezone
+from email.utils import format_datetime
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional
+
+from .auth.security import _sign
+from .config import settings
+from .recurrence import BYDAY, first_session
+
+ICS_MEDIA_TYPE = 'text/calendar'
+PRODID = '-//TechConnect//Sports schedule//RU'
+# Part of every ETag: bump when the rendered output changes so old ETags stop matching
+FEED_FORMAT = 2
+
+
+def feed_signature(user_id: int) -> str:
+    """Unguessable token of a user's feed URL (HMAC with the JWT secret)."""
+    return _sign(f'calendar-feed:{user_id}'.encode('utf-8'))
+
+
+def check_feed_signature(user_id: int, sig: str) -> bool:
+    return hmac.compare_digest(sig.encode('utf-8'), feed_signature(user_id).encode('utf-8'))
+
+
+def feed_etag(user_id: int, version: str) -> str:
+    """Strong ETag: the body is a function of the user's feed version
+    (CalendarFeed.version, which includes each shard's epoch).
+    """
+    key = f'{FEED_FORMAT}:{settings.ics_class_minutes}:{user_id}:{version}'
+    return '"%s"' % hashlib.blake2b(key.encode('utf-8'), digest_size=12).hexdigest()
+
+
+def _utc(changed_at: Optional[str]) -> Optional[datetime]:
+    if not changed_at:
+        return None
+    return datetime.fromisoformat(changed_at).replace(tzinfo=timezone.utc)
+
+
+def feed_headers(etag: str, changed_at: Optional[str]) -> Dict[str, str]:
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    modified = _utc(changed_at)
+    if modified is not None:
+        headers['Last-Modified'] = format_datetime(modified, usegmt=True)
+    return headers
+
+
+def not_modified(request_headers: Mapping[str, str], etag: str) -> bool:
+    """Conditional GET on the ETag alone. If-Modified-Since is ignored (RFC
+    9110 allows it): Last-Modified has one-second granularity, and a second
+    change within the same second would be answered 304.
+    """
+    inm = request_headers.get('if-none-match')
+    if inm is None:
+        return False
+    tags = {t.strip() for t in inm.split(',')}
+    # Weak comparison, as the spec requires for If-None-Match
+    return bool(tags & {'*', etag, f'W/{etag}'})
+
+
+def _escape(text: str) -> str:
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _line(text: str) -> bytes:
+    """One content line folded at 75 octets (RFC 5545 3.1), CRLF-terminated."""
+    raw = text.encode('utf-8')
+    if len(raw) <= 75:
+        return raw + b'\r\n'
+    parts, cur = [], b''
+    for ch in text:
+        b = ch.encode('utf-8')
+        if len(cur) + len(b) > 75:
+            parts.append(cur)
+            cur = b' '
+        cur += b
+    parts.append(cur)
+    return b'\r\n'.join(parts) + b'\r\n'
+
+
+def _local(value: datetime) -> str:
+    # Floating time: classes.date is wall-clock time at the venue
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def _rule_lines(rule: Mapping, duration: timedelta) -> Optional[List[str]]:
+    """DTSTART..EXDATE of a weekly schedule rule; None when its term has no session."""
+    first = first_session(rule)
+    if first is None:
+        return None
+    at = time.fromisoformat(rule['start_time'])
+    start = datetime.combine(first, at)
+    days = ','.join(code for i, code in enumerate(BYDAY) if rule['weekdays'] >> i & 1)
+    until = datetime.combine(date.fromisoformat(rule['ends_on']), time(23, 59, 59))
+    lines = [
+        f"UID:schedule-{rule['id']}@techconnect",
+        f'DTSTART:{_local(start)}',
+        f'DTEND:{_local(start + duration)}',
+        f'RRULE:FREQ=WEEKLY;BYDAY={days};UNTIL={_local(until)}',
+    ]
+    if rule['exdates']:
+        exdates = sorted(rule['exdates'].split(','))
+        lines.append('EXDATE:' + ','.join(_local(datetime.combine(date.fromisoformat(d), at)) for d in exdates))
+    return lines
+
+
+def render(events: Iterable[Mapping], changed_at: Optional[str]) -> Iterator[bytes]:
+    """VCALENDAR as chunks: the header, one VEVENT per class row, the footer.
+    Rows need id, date, location and section; schedule rule rows (with
+    weekdays, start_time, starts_on, ends_on, exdates instead of date) become
+    one recurring VEVENT each. Nothing is collected first.
+    """
+    modified = _utc(changed_at)
+    stamp = (modified or datetime(1970, 1, 1, tzinfo=timezone.utc)).strftime('%Y%m%dT%H%M%SZ')
+    duration = timedelta(minutes=settings.ics_class_minutes)
+    yield b''.join([
+        _line('BEGIN:VCALENDAR'),
+        _line('VERSION:2.0'),
+        _line(f'PRODID:{PRODID}'),
+        _line('CALSCALE:GREGORIAN'),
+        _line('METHOD:PUBLISH'),
+        _line('X-WR-CALNAME:Спортивные секции'),
+    ])
+    for ev in events:
+        if 'weekdays' in ev.keys():
+            timing = _rule_lines(ev, duration)
+            if timing is None:
+                continue
+        else:
+            start = datetime.fromisoformat(ev['date'])
+            timing = [
+                f"UID:class-{ev['id']}@techconnect",
+                f'DTSTART:{_local(start)}',
+                f'DTEND:{_local(start + duration)}',
+            ]
+        lines = [
+            'BEGIN:VEVENT',
+            timing[0],
+            f'DTSTAMP:{stamp}',
+            *timing[1:],
+            f"SUMMARY:{_escape(ev['section'])}",
+        ]
+        if ev['location']:
+            lines.append(f"LOCATION:{_escape(ev['location'])}")
+        lines.append('END:VEVENT')
+        yield b''.join(_line(x) for x in lines)
+    yield _line('END:VCALENDAR')
+
+
+class FeedCache:
+    """LRU of rendered feeds: one body per user, valid for one ETag."""
+
+    def __init__(self, entries: int = 1024):
+        self.entries = entries
+        self._bodies: 'OrderedDict[int, tuple]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int, etag: str) -> Optional[bytes]:
+        with self._lock:
+            hit = self._bodies.get(user_id)
+            if hit is None or hit[0] != etag:
+                return None
+            self._bodies.move_to_end(user_id)
+            return hit[1]
+
+    def put(self, user_id: int, etag: str, body: bytes) -> None:
+        with self._lock:
+            self._bodies[user_id] = (etag, body)
+            self._bodies.move_to_end(user_id)
+            while len(self._bodies) > self.entries:
+                self._bodies.popitem(last=False)
+
+    def capture(self, user_id: int, etag: str, chunks: Iterable[bytes]) -> Iterator[bytes]:
+        """Pass chunks through; cache the body once the last one was produced."""
+        parts = []
+        for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        self.put(user_id, etag, b''.join(parts))
+
+
+feed_cache = FeedCache(settings.ics_cache_entries)
@@ -0,0 +1,82 @@
+import sqlite3
+from typing import Optional, Dict, Any
+
+from fastapi import Depends, HTTPException, Request
+
+from .auth.db import AUTH_DB_PATH
+from .auth.security import _decode_token
+from .storage import storage
+
+# auth user -> auth_links -> sports user in one statement; every hop is a
+# primary key or UNIQUE index lookup.
+_RESOLVE_SQL = (
+    "SELECT au.id AS auth_user_id, au.login, l.sports_user_id, su.role, su.full_name "
+    "FROM auth.users au "
+    "LEFT JOIN main.auth_links l ON l.auth_login = lower(trim(au.login)) "
+    "LEFT JOIN main.users su ON su.id = l.sports_user_id "
+    "WHERE au.id = ?"
+)
+
+def _identity_conn() -> sqlite3.Connection:
+    """Sports DB connection with auth.db attached as schema `auth`."""
+    conn = sqlite3.connect(str(storage.global_path))
+    conn.row_factory = sqlite3.Row
+    conn.execute('ATTACH DATABASE ? AS auth', (str(AUTH_DB_PATH),))
+    return conn
+
+def member_role(role: Optional[str]) -> str:
+    """Role used for section membership lookups (admins browse as students)."""
+    return 'teacher' if role == 'teacher' else 'student'
+
+def resolve_identity(auth_user_id: int) -> Optional[Dict[str, Any]]:
+    """Resolve auth user -> sports user -> role -> full_name.
+    Returns None when the auth user does not exist; sports fields are None
+    when the login is not linked to a sports user.
+    """
+    with _identity_conn() as c:
+        row = c.execute(_RESOLVE_SQL, (auth_user_id,)).fetchone()
+    if not row:
+        return None
+    role = row['role'].lower() if row['role'] else None
+    return {
+        'auth_user_id': row['auth_user_id'],
+        'login': row['login'],
+        'sports_user_id': row['sports_user_id'],
+        'role': role,
+        'full_name': row['full_name'],
+    }
+
+def get_identity(request: Request) -> Optional[Dict[str, Any]]:
+    """Dependency: identity of the session cookie owner, or None."""
+    # Sub-requests of /api/batch reuse the identity resolved for the batch
+    cached = request.scope.get('state', {}).get('identity')
+    if cached is not None:
+        return cached
+    token = request.cookies.get("tc_session")
+    if not token:
+        return None
+    payload = _decode_token(token)
+    if not payload:
+        return None
+    try:
+        auth_user_id = int(payload.get("sub"))
+    except Exception:
+        return None
+    return resolve_identity(auth_user_id)
+
+def require_identity(identity = Depends(get_identity)) -> Dict[str, Any]:
+    """Dependency: like get_identity but requires a linked sports user."""
+    if not identity:
+        raise HTTPException(status_code=401, detail='Требуется авторизация')
+    if identity['sports_user_id'] is None:
+        raise HTTPException(status_code=403, detail='Учетная запись не привязана к пользователю')
+    return identity
+
+def effective_user_id(identity: Dict[str, Any], user_id: Optional[int]) -> int:
+    """Sports user id a request acts on. The legacy `user_id` query parameter
+    is accepted only when it matches the authenticated user.
+    """
+    sports_user_id = identity['sports_user_id']
+    if user_id is not None and user_id != sports_user_id:
+        raise HTTPException(status_code=403, detail='Нет доступа к данным другого пользователя')
+    return sports_user_id
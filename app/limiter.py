@@ -0,0 +1,136 @@
+import json
+import threading
+import time
+from typing import Dict, Tuple
+
+WRITE_METHODS = ("POST", "PUT", "PATCH", "DELETE")
+# POST routes that only read; admitted as browse traffic
+READ_ONLY_POSTS = ("/api/batch",)
+# Auth requests also count as browse: logins are buffered (write-behind), and
+# a login storm must not take the reserve kept for data writes
+BROWSE_PREFIXES = (*READ_ONLY_POSTS, "/auth/")
+# Probes and diagnostics bypass the limiter so they answer while shedding
+EXEMPT_PREFIXES = ("/health", "/ready", "/debug")
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit driven by observed request latency.
+
+    Every completed request is a sample. While samples stay under
+    `target_latency` and the limit is actually in use, the limit grows by
+    about one per `limit` completions (additive increase). A slow sample or a
+    server error cuts it by `backoff` (multiplicative decrease), at most once
+    per `target_latency` so one burst doesn't collapse it.
+
+    Browse requests may use `1 - write_reserve` of the limit; the remainder
+    is kept for data writes (attendance marks, enrollment), so they are
+    still admitted when browse traffic, logins included, is being shed.
+    """
+
+    def __init__(self, initial: int = 32, min_limit: int = 4, max_limit: int = 256,
+                 target_latency: float = 0.25, backoff: float = 0.9, write_reserve: float = 0.2):
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency
+        self.backoff = backoff
+        self.write_reserve = write_reserve
+        self.inflight = 0
+        self.latency_ewma = 0.0
+        self.admitted = 0
+        self.shed = {"browse": 0, "write": 0}
+        self.last_shed_at = 0.0
+        self._last_decrease = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self, priority: str) -> bool:
+        with self._lock:
+            cap = self.limit if priority == "write" else self.limit * (1 - self.write_reserve)
+            if self.inflight >= max(1, int(cap)):
+                self.shed[priority] += 1
+                self.last_shed_at = time.monotonic()
+                return False
+            self.inflight += 1
+            self.admitted += 1
+            return True
+
+    def release(self, latency: float, failed: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            busy = self.inflight >= self.limit / 2
+            self.inflight -= 1
+            self.latency_ewma = latency if not self.latency_ewma else 0.9 * self.latency_ewma + 0.1 * latency
+            if failed or latency > self.target_latency:
+                if now - self._last_decrease >= self.target_latency:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            elif busy:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def saturated(self) -> bool:
+        return self.inflight >= int(self.limit)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "limit": round(self.limit, 2),
+                "browse_limit": max(1, int(self.limit * (1 - self.write_reserve))),
+                "inflight": self.inflight,
+                "latency_ewma_ms": round(self.latency_ewma * 1000, 2),
+                "target_latency_ms": round(self.target_latency * 1000, 2),
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+            }
+
+
+def _priority(method: str, path: str) -> str:
+    if method in WRITE_METHODS and not path.startswith(BROWSE_PREFIXES):
+        return "write"
+    return "browse"
+
+
+_SHED_BODY = json.dumps({"detail": "Сервер перегружен, повторите запрос позже"}, ensure_ascii=False).encode("utf-8")
+_SHED_HEADERS: Tuple[Tuple[bytes, bytes], ...] = (
+    (b"content-type", b"application/json"),
+    (b"content-length", str(len(_SHED_BODY)).encode("ascii")),
+    (b"retry-after", b"1"),
+)
+
+
+class ConcurrencyLimitMiddleware:
+    """Admits requests up to the limiter's current limit and answers the rest
+    immediately with 503 + Retry-After instead of queueing them.
+    """
+
+    def __init__(self, app, limiter: AdaptiveLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(EXEMPT_PREFIXES) or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+        if not self.limiter.try_acquire(_priority(scope["method"], scope["path"])):
+            await send({"type": "http.response.start", "status": 503, "headers": list(_SHED_HEADERS)})
+            await send({"type": "http.response.body", "body": _SHED_BODY})
+            return
+
+        status = 500
+        started = time.perf_counter()
+        # Time to the response start: sending the body (streamed feeds, slow
+        # clients) holds the slot but says nothing about server latency
+        latency = None
+
+        async def send_wrapper(message):
+            nonlocal status, latency
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                latency = time.perf_counter() - started
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if latency is None:
+                latency = time.perf_counter() - started
+            self.limiter.release(latency, failed=status >= 500)
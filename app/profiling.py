@@ -0,0 +1,206 @@
+import asyncio
+import cProfile
+import io
+import itertools
+import marshal
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+from fastapi.routing import APIRoute
+
+_profile_lock = threading.Lock()
+
+
+def _frame_label(code) -> str:
+    # ';' separates frames in collapsed stacks
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> Optional[Counter]:
+    """Statistical sampler over all threads except the caller.
+
+    Every `interval` seconds the current frame of each thread is walked and
+    counted as a root-first collapsed stack prefixed with the thread name.
+    Returns None if another sampling run is in progress.
+    """
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame.f_code))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}").replace(";", ":").replace(" ", "_"))
+                stacks[";".join(reversed(labels))] += 1
+            time.sleep(interval)
+        return stacks
+    finally:
+        _profile_lock.release()
+
+
+async def run_on_own_thread(call: Callable, *args: Any) -> Any:
+    """Await call(*args) on a new thread rather than the AnyIO threadpool,
+    which is exactly what is exhausted when the server needs diagnosing.
+    """
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+
+    def settle(result: Any, exc: Optional[BaseException]) -> None:
+        if done.cancelled():
+            return
+        if exc is not None:
+            done.set_exception(exc)
+        else:
+            done.set_result(result)
+
+    def run() -> None:
+        try:
+            result = call(*args)
+        except BaseException as exc:
+            loop.call_soon_threadsafe(settle, None, exc)
+        else:
+            loop.call_soon_threadsafe(settle, result, None)
+
+    threading.Thread(target=run, name="debug-sampler", daemon=True).start()
+    return await done
+
+
+def collapsed(stacks: Counter) -> str:
+    """flamegraph.pl / speedscope "collapsed" format: `frame;frame;frame count`."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+# Set per request by SlowRequestCapture when the request is sampled
+_active_profile: ContextVar[Optional[cProfile.Profile]] = ContextVar("_active_profile", default=None)
+
+
+def _profiled(call: Callable) -> Callable:
+    @wraps(call)
+    def wrapper(*args, **kwargs):
+        profile = _active_profile.get()
+        if profile is None:
+            return call(*args, **kwargs)
+        # cProfile hooks the current thread only: enable it in the worker
+        # thread the sync handler runs on.
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active (interpreter-wide sys.monitoring on
+            # Python 3.12+): profiling must never fail the request
+            return call(*args, **kwargs)
+        try:
+            return call(*args, **kwargs)
+        finally:
+            profile.disable()
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """APIRoute whose sync handlers can be traced by SlowRequestCapture."""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs: Any):
+        if not asyncio.iscoroutinefunction(endpoint):
+            endpoint = _profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+
+class SlowRequestCapture:
+    """Opt-in capture of cProfile traces for slow requests.
+
+    When `threshold_ms` > 0, a `sample` fraction of requests is traced; traces
+    of requests slower than the threshold are kept in a ring buffer of
+    `keep` entries. Disabled (zero overhead beyond one check) otherwise.
+    One request is traced at a time; requests arriving meanwhile run
+    untraced (on Python 3.12+ cProfile is interpreter-wide and a second
+    active profiler is refused).
+    """
+
+    def __init__(self, threshold_ms: float = 0, sample: float = 1.0, keep: int = 20):
+        self.threshold_ms = threshold_ms
+        self.sample = sample
+        self.entries: Deque[Dict[str, Any]] = deque(maxlen=keep)
+        self._ids = itertools.count(1)
+        self._busy = threading.Lock()
+
+    def configure(self, threshold_ms: float, sample: float) -> None:
+        self.threshold_ms = threshold_ms
+        self.sample = sample
+
+    def start(self) -> Optional[cProfile.Profile]:
+        if self.threshold_ms <= 0 or random.random() >= self.sample:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        return cProfile.Profile()
+
+    def finish(self, profile: cProfile.Profile, method: str, path: str, elapsed_ms: float) -> None:
+        """Keep the trace if the request was slow; ends the capture started by start()."""
+        try:
+            self._keep(profile, method, path, elapsed_ms)
+        finally:
+            self._busy.release()
+
+    def _keep(self, profile: cProfile.Profile, method: str, path: str, elapsed_ms: float) -> None:
+        if elapsed_ms < self.threshold_ms:
+            return
+        profile.create_stats()
+        if not profile.stats:
+            # No profiled handler ran (async route, routing error)
+            return
+        stats = pstats.Stats(profile)
+        out = io.StringIO()
+        stats.stream = out
+        stats.sort_stats("cumulative").print_stats(40)
+        self.entries.append({
+            "id": next(self._ids),
+            "method": method,
+            "path": path,
+            "elapsed_ms": round(elapsed_ms, 2),
+            "captured_at": datetime.utcnow().isoformat(),
+            "report": out.getvalue(),
+            # same bytes pstats.Stats.dump_stats writes: loadable by pstats/snakeviz
+            "prof": marshal.dumps(stats.stats),
+        })
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [{k: v for k, v in e.items() if k not in ("report", "prof")} for e in self.entries]
+
+    def get(self, entry_id: int) -> Optional[Dict[str, Any]]:
+        return next((e for e in self.entries if e["id"] == entry_id), None)
+
+
+class SlowRequestMiddleware:
+    def __init__(self, app, capture: SlowRequestCapture):
+        self.app = app
+        self.capture = capture
+
+    async def __call__(self, scope, receive, send):
+        traced = scope["type"] == "http" and not scope["path"].startswith("/debug")
+        profile = self.capture.start() if traced else None
+        if profile is None:
+            await self.app(scope, receive, send)
+            return
+        token = _active_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _active_profile.reset(token)
+            self.capture.finish(profile, scope["method"], scope["path"], (time.perf_counter() - started) * 1000)
@@ -0,0 +1,118 @@
+"""Weekly class rules of sections (section_schedules in init.sql).
+
+Sessions of a rule are not stored: they are expanded per month when read and
+kept in an LRU keyed by (rule id, rule revision, month). Triggers bump the
+revision whenever the rule or one of its exception dates changes, so stale
+months are never served. Until attendance is recorded a session has a
+virtual (negative) class id; recording creates its classes row.
+"""
+import calendar
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from typing import Mapping, Optional, Tuple
+
+from .config import settings
+
+# Bit i of section_schedules.weekdays is date.weekday() == i (0 = Monday)
+BYDAY = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+# Virtual class id of a session: -(rule_id * DAY_SPAN + days since EPOCH)
+EPOCH = date(1970, 1, 1)
+DAY_SPAN = 100000
+
+
+def virtual_class_id(rule_id: int, day: date) -> int:
+    return -(rule_id * DAY_SPAN + (day - EPOCH).days)
+
+
+def parse_virtual_class_id(class_id: int) -> Optional[Tuple[int, date]]:
+    """(rule id, day) of a virtual class id; None for stored classes."""
+    if class_id >= 0:
+        return None
+    rule_id, days = divmod(-class_id, DAY_SPAN)
+    if not rule_id:
+        return None
+    return rule_id, EPOCH + timedelta(days=days)
+
+
+def month_range(month: str) -> Optional[Tuple[date, date]]:
+    """First and last day of YYYY-MM; None when it is not a real month."""
+    try:
+        first = date(int(month[:4]), int(month[5:7]), 1)
+    except ValueError:
+        return None
+    return first, first.replace(day=calendar.monthrange(first.year, first.month)[1])
+
+
+def expand_month(rule: Mapping, month: str, exceptions: frozenset) -> Tuple[int, ...]:
+    """Days of `month` the rule has a session on (term bounds inclusive,
+    exception dates left out).
+    """
+    bounds = month_range(month)
+    if bounds is None:
+        return ()
+    first = max(bounds[0], date.fromisoformat(rule['starts_on']))
+    last = min(bounds[1], date.fromisoformat(rule['ends_on']))
+    days = []
+    day = first
+    while day <= last:
+        if rule['weekdays'] >> day.weekday() & 1 and day.isoformat() not in exceptions:
+            days.append(day.day)
+        day += timedelta(days=1)
+    return tuple(days)
+
+
+def first_session(rule: Mapping) -> Optional[date]:
+    """First day of the term the rule meets on, exceptions included (ICS DTSTART)."""
+    day = date.fromisoformat(rule['starts_on'])
+    last = date.fromisoformat(rule['ends_on'])
+    for _ in range(7):
+        if day > last:
+            break
+        if rule['weekdays'] >> day.weekday() & 1:
+            return day
+        day += timedelta(days=1)
+    return None
+
+
+class ExpansionCache:
+    """LRU of expanded months: (rule id, revision, month) -> days."""
+
+    def __init__(self, entries: int = 4096):
+        self.entries = entries
+        self._days: 'OrderedDict[tuple, Tuple[int, ...]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def days(self, conn: sqlite3.Connection, rule: Mapping, month: str) -> Tuple[int, ...]:
+        """Session days of the rule in `month`. `rule` needs the
+        section_schedules columns; `conn` is its shard (exceptions are read
+        from it on a miss).
+        """
+        key = (rule['id'], rule['revision'], month)
+        with self._lock:
+            hit = self._days.get(key)
+            if hit is not None:
+                self._days.move_to_end(key)
+                return hit
+        exceptions = frozenset(r[0] for r in conn.execute(
+            'SELECT date FROM section_schedule_exceptions WHERE schedule_id = ? AND date LIKE ?',
+            (rule['id'], f'{month}-%')
+        ))
+        days = expand_month(rule, month, exceptions)
+        with self._lock:
+            self._days[key] = days
+            self._days.move_to_end(key)
+            while len(self._days) > self.entries:
+                self._days.popitem(last=False)
+        return days
+
+    def bits(self, conn: sqlite3.Connection, rule: Mapping, month: str) -> int:
+        """The same days as a calendar_bits bitmap (bit d-1 = day d)."""
+        bits = 0
+        for d in self.days(conn, rule, month):
+            bits |= 1 << (d - 1)
+        return bits
+
+
+expansions = ExpansionCache(settings.recurrence_cache_months)
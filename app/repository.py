@@ -0,0 +1,553 @@
+import json
+import sqlite3
+from datetime import date as Date, datetime
+from operator import itemgetter
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .recurrence import expansions, month_range, parse_virtual_class_id, virtual_class_id
+from .storage import Storage, storage as default_storage
+
+_by_name = itemgetter('name')
+_by_date = itemgetter('date')
+
+
+class CalendarFeed:
+    """A user's ICS feed data in one read transaction per shard: the version
+    is read first and the events stream from the same snapshot, so a body
+    always matches the version it is labelled with. events() closes it; call
+    close() when the events are not needed.
+    """
+
+    def __init__(self, storage: Storage, user_id: int):
+        self.user_id = user_id
+        self._conns: List[sqlite3.Connection] = []
+        versions: List[str] = []
+        changed: List[str] = []
+        try:
+            for shard in storage.shards():
+                # events() is iterated by StreamingResponse from worker threads
+                conn = storage.open(shard, check_same_thread=False)
+                self._conns.append(conn)
+                conn.execute('BEGIN')
+                epoch = conn.execute('SELECT epoch FROM calendar_epoch').fetchone()['epoch']
+                row = conn.execute(
+                    'SELECT version, changed_at FROM calendar_versions WHERE user_id = ?', (user_id,)
+                ).fetchone()
+                versions.append(f"{epoch}:{row['version'] if row else 0}")
+                if row:
+                    changed.append(row['changed_at'])
+        except BaseException:
+            self.close()
+            raise
+        # Trigger-maintained, per shard and tagged with the shard file's epoch
+        # (see calendar_versions and calendar_epoch in init.sql)
+        self.version = '.'.join(versions)
+        self.changed_at: Optional[str] = max(changed) if changed else None
+
+    def events(self) -> Iterator[sqlite3.Row]:
+        """Classes of every section the user is a member of, then the
+        sections' schedule rules (rows with weekdays), streamed from the
+        cursor. Sessions stored for a rule are left out: the rule covers them.
+        The cursors are iterated, not delegated to with `yield from`: closing
+        this generator after close() would otherwise close a cursor of a
+        closed connection.
+        """
+        try:
+            for conn in self._conns:
+                for row in conn.execute(
+                    "SELECT c.id, c.date, c.location, s.name AS section "
+                    "FROM section_members m "
+                    "JOIN classes c ON c.section_id = m.section_id "
+                    "JOIN sections s ON s.id = m.section_id "
+                    "WHERE m.user_id = ? "
+                    "AND (c.schedule_id IS NULL OR NOT EXISTS (SELECT 1 FROM section_schedules r WHERE r.id = c.schedule_id)) "
+                    "ORDER BY c.date, c.id",
+                    (self.user_id,)
+                ):
+                    yield row
+            for conn in self._conns:
+                for row in conn.execute(
+                    "SELECT r.id, r.weekdays, r.start_time, r.location, r.starts_on, r.ends_on, s.name AS section, "
+                    "(SELECT group_concat(e.date) FROM section_schedule_exceptions e WHERE e.schedule_id = r.id) AS exdates "
+                    "FROM section_members m "
+                    "JOIN section_schedules r ON r.section_id = m.section_id "
+                    "JOIN sections s ON s.id = m.section_id "
+                    "WHERE m.user_id = ? ORDER BY r.starts_on, r.id",
+                    (self.user_id,)
+                ):
+                    yield row
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        for conn in self._conns:
+            conn.rollback()
+            conn.close()
+        self._conns = []
+
+
+class SportsRepository:
+    """All sports data access used by the API.
+
+    Per-section reads and writes run on the section's shard; per-user reads
+    run on every shard and are merged here (lists re-sorted, calendar
+    bitmaps OR-ed). Names and emails live in the global `users` table and are
+    looked up there by id, so no query joins across files.
+
+    Sessions of schedule rules are expanded on read (app/recurrence.py) and
+    merged with the stored classes; they carry virtual class ids until
+    set_attendance stores them.
+    """
+
+    def __init__(self, storage: Storage):
+        self.storage = storage
+
+    def _fan_out(self, sql: str, params: tuple) -> List[sqlite3.Row]:
+        rows: List[sqlite3.Row] = []
+        for shard in self.storage.shards():
+            with self.storage.connect(shard) as c:
+                rows.extend(c.execute(sql, params).fetchall())
+        return rows
+
+    def _users(self, ids: List[int]) -> List[Dict[str, Any]]:
+        """id, full_name, email of the given users ordered by full_name."""
+        if not ids:
+            return []
+        with self.storage.connect() as g:
+            rows = g.execute(
+                "SELECT id, full_name, email FROM users "
+                "WHERE id IN (SELECT value FROM json_each(?)) ORDER BY full_name",
+                (json.dumps(ids),)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    # Per-user reads (fan-out)
+
+    def user_sections(self, user_id: int, role: str) -> List[Dict[str, Any]]:
+        rows = self._fan_out(
+            "SELECT s.id, s.name, s.description FROM sections s "
+            "JOIN section_members m ON m.section_id = s.id "
+            "WHERE m.user_id = ? AND m.role = ? ORDER BY s.name",
+            (user_id, role)
+        )
+        return sorted((dict(r) for r in rows), key=_by_name)
+
+    def schedule(self, user_id: int, role: str, date: str) -> List[Dict[str, Any]]:
+        if role == 'student':
+            sql = (
+                "SELECT c.id, c.section_id, s.name AS section, c.date, c.location, "
+                "IFNULL(a.status, '') AS attendance_status, c.schedule_id "
+                "FROM classes c "
+                "JOIN sections s ON s.id = c.section_id "
+                "JOIN section_members m ON m.section_id = c.section_id AND m.role = ? AND m.user_id = ? "
+                "LEFT JOIN attendance a ON a.class_id = c.id AND a.student_id = ? "
+                "WHERE date(c.date) = date(?) "
+                "ORDER BY c.date"
+            )
+            params: tuple = (role, user_id, user_id, date)
+        else:
+            sql = (
+                "SELECT c.id, c.section_id, s.name AS section, c.date, c.location, c.schedule_id "
+                "FROM classes c "
+                "JOIN sections s ON s.id = c.section_id "
+                "JOIN section_members m ON m.section_id = c.section_id AND m.role = ? AND m.user_id = ? "
+                "WHERE date(c.date) = date(?) "
+                "ORDER BY c.date"
+            )
+            params = (role, user_id, date)
+        try:
+            day: Optional[Date] = datetime.fromisoformat(date).date()
+        except ValueError:
+            day = None
+        classes: List[Dict[str, Any]] = []
+        for shard in self.storage.shards():
+            with self.storage.connect(shard) as c:
+                rows = [dict(r) for r in c.execute(sql, params)]
+                # Rules whose session of the day is already stored
+                stored = {r.pop('schedule_id') for r in rows}
+                classes.extend(rows)
+                if day is None:
+                    continue
+                for rule in _user_rules(c, user_id, day.isoformat(), day.isoformat(), role):
+                    if rule['id'] not in stored and day.day in expansions.days(c, rule, day.strftime('%Y-%m')):
+                        classes.append(_session(rule, day, role))
+        return sorted(classes, key=_by_date)
+
+    def month_bits(self, user_id: int, month: str, kind: str) -> int:
+        """Bitmap of days (bit d-1 = day d) from the trigger-maintained
+        calendar_bits; 'scheduled_<role>' adds the sessions of the rules of
+        the sections the user has that role in.
+        """
+        role = kind[len('scheduled_'):] if kind.startswith('scheduled_') else None
+        bounds = month_range(month) if role else None
+        bits = 0
+        for shard in self.storage.shards():
+            with self.storage.connect(shard) as c:
+                for r in c.execute(
+                    'SELECT bits FROM calendar_bits WHERE user_id = ? AND month = ? AND kind = ?',
+                    (user_id, month, kind)
+                ):
+                    bits |= r['bits']
+                if bounds is None:
+                    continue
+                for rule in _user_rules(c, user_id, bounds[0].isoformat(), bounds[1].isoformat(), role):
+                    bits |= expansions.bits(c, rule, month)
+        return bits
+
+    def year_bits(self, user_id: int, year: int, role: str) -> Dict[str, Dict[str, int]]:
+        """{"YYYY-MM": {kind: bits}} for every non-empty bitmap of the year;
+        'scheduled' is the class days of the sections the user has `role` in.
+        """
+        months: Dict[str, Dict[str, int]] = {}
+        for r in self._fan_out(
+            "SELECT month, kind, bits FROM calendar_bits "
+            "WHERE user_id = ? AND month BETWEEN ? AND ? AND bits <> 0 "
+            "AND kind IN (?, 'present', 'absent', 'late')",
+            (user_id, f"{year:04d}-01", f"{year:04d}-12", f'scheduled_{role}')
+        ):
+            kinds = months.setdefault(r['month'], {})
+            kind = 'scheduled' if r['kind'].startswith('scheduled_') else r['kind']
+            kinds[kind] = kinds.get(kind, 0) | r['bits']
+        for shard in self.storage.shards():
+            with self.storage.connect(shard) as c:
+                for rule in _user_rules(c, user_id, f"{year:04d}-01-01", f"{year:04d}-12-31", role):
+                    # Only the months of the rule's term within the year
+                    first = max(rule['starts_on'][:7], f"{year:04d}-01")
+                    last = min(rule['ends_on'][:7], f"{year:04d}-12")
+                    for m in range(int(first[5:]), int(last[5:]) + 1):
+                        month = f"{year:04d}-{m:02d}"
+                        bits = expansions.bits(c, rule, month)
+                        if bits:
+                            kinds = months.setdefault(month, {})
+                            kinds['scheduled'] = kinds.get('scheduled', 0) | bits
+        return dict(sorted(months.items()))
+
+    def has_class_later_today(self, user_id: int, now: datetime) -> bool:
+        """Whether one of the student's classes starts at or after `now` today."""
+        sql = (
+            "SELECT 1 FROM classes c "
+            "JOIN section_members m ON m.section_id = c.section_id AND m.role = 'student' "
+            "WHERE m.user_id = ? AND datetime(c.date) >= datetime(?) "
+            "AND datetime(c.date) < datetime(date(?, '+1 day')) LIMIT 1"
+        )
+        start = now.strftime('%Y-%m-%d %H:%M:%S')
+        today = now.date()
+        params = (user_id, start, today.isoformat())
+        for shard in self.storage.shards():
+            with self.storage.connect(shard) as c:
+                if c.execute(sql, params).fetchone():
+                    return True
+                for rule in _user_rules(c, user_id, today.isoformat(), today.isoformat(), 'student'):
+                    if (f"{today.isoformat()} {rule['start_time']}:00" >= start
+                            and today.day in expansions.days(c, rule, today.strftime('%Y-%m'))):
+                        return True
+        return False
+
+    def teacher_sections(self, user_id: int) -> List[Dict[str, Any]]:
+        """Sections where the teacher has edit permissions."""
+        rows = self._fan_out(
+            "SELECT DISTINCT s.id, s.name, s.description "
+            "FROM sections s "
+            "JOIN section_permissions p ON p.section_id = s.id "
+            "WHERE p.user_id = ? AND p.permission IN ('edit_section','edit_attendance') "
+            "ORDER BY s.name",
+            (user_id,)
+        )
+        return sorted((dict(r) for r in rows), key=_by_name)
+
+    def all_sections(self) -> List[Dict[str, Any]]:
+        rows = self._fan_out('SELECT id, name, description FROM sections ORDER BY name', ())
+        return sorted((dict(r) for r in rows), key=_by_name)
+
+    def available_sections(self, user_id: int) -> List[Dict[str, Any]]:
+        """Sections where the user is NOT currently a member as a student."""
+        rows = self._fan_out(
+            "SELECT s.id, s.name, s.description FROM sections s "
+            "WHERE s.id NOT IN (SELECT section_id FROM section_members WHERE user_id = ? AND role = 'student') "
+            "ORDER BY s.name",
+            (user_id,)
+        )
+        return sorted((dict(r) for r in rows), key=_by_name)
+
+    def calendar_feed(self, user_id: int) -> CalendarFeed:
+        return CalendarFeed(self.storage, user_id)
+
+    # Per-section reads (one shard)
+
+    def section(self, section_id: int) -> Optional[Dict[str, Any]]:
+        shard = self.storage.shard_for_section(section_id)
+        if shard is None:
+            return None
+        with self.storage.connect(shard) as c:
+            row = c.execute(
+                'SELECT id, name, description, capacity, member_count FROM sections WHERE id = ?', (section_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def section_students(self, section_id: int) -> List[Dict[str, Any]]:
+        shard = self.storage.shard_for_section(section_id)
+        if shard is None:
+            return []
+        with self.storage.connect(shard) as c:
+            ids = [r[0] for r in c.execute(
+                "SELECT user_id FROM section_members WHERE section_id = ? AND role = 'student'", (section_id,)
+            )]
+        return self._users(ids)
+
+    def _class_shard(self, class_id: int) -> Optional[str]:
+        virtual = parse_virtual_class_id(class_id)
+        if virtual is not None:
+            return self.storage.shard_for_schedule(virtual[0])
+        return self.storage.shard_for_class(class_id)
+
+    def class_students(self, class_id: int) -> List[Dict[str, Any]]:
+        """Students of the class's section with their mark ('' when none).
+        A virtual class id resolves to the session's stored row when there is one.
+        """
+        shard = self._class_shard(class_id)
+        if shard is None:
+            return []
+        virtual = parse_virtual_class_id(class_id)
+        with self.storage.connect(shard) as c:
+            if virtual is not None:
+                stored = _stored_session(c, *virtual)
+                if stored is None:
+                    rule = _session_rule(c, *virtual)
+                    if rule is None:
+                        return []
+                    # Not stored yet, so nobody has a mark
+                    ids = [r[0] for r in c.execute(
+                        "SELECT user_id FROM section_members WHERE section_id = ? AND role = 'student'",
+                        (rule['section_id'],)
+                    )]
+                    return [{**u, 'status': ''} for u in self._users(ids)]
+                class_id = stored
+            status = {r[0]: r[1] for r in c.execute(
+                "SELECT m.user_id, IFNULL(a.status, '') "
+                "FROM classes c "
+                "JOIN section_members m ON m.section_id = c.section_id AND m.role='student' "
+                "LEFT JOIN attendance a ON a.class_id = c.id AND a.student_id = m.user_id "
+                "WHERE c.id = ?",
+                (class_id,)
+            )}
+        return [{**u, 'status': status[u['id']]} for u in self._users(list(status))]
+
+    # Writes
+
+    def set_attendance(self, class_id: int, student_ids: List[int], status: str,
+                       notes: Optional[str], replace: bool) -> Optional[Tuple[int, Dict[int, str]]]:
+        """Upsert marks of the class; in replace mode also remove 'present'
+        marks of students not listed. A virtual class id (a session of a
+        schedule rule) gets its classes row here. Returns the stored class id
+        and the marks before the change (student_id -> status), or None when
+        the class does not exist.
+        """
+        shard = self._class_shard(class_id)
+        if shard is None:
+            return None
+        virtual = parse_virtual_class_id(class_id)
+        sql = (
+            "INSERT INTO attendance (class_id, student_id, status, notes) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(class_id, student_id) DO UPDATE SET status=excluded.status, notes=excluded.notes"
+        )
+        # The shard's write gate, like enroll/withdraw: writers queue on it
+        # instead of starving in SQLite's busy handler during a sign-up storm
+        with self.storage.write_gate(shard), self.storage.connect(shard) as c:
+            cur = c.cursor()
+            # Read previous marks in the same write transaction for the audit trail
+            cur.execute('BEGIN IMMEDIATE')
+            if virtual is not None:
+                class_id = _store_session(c, *virtual)
+                if class_id is None:
+                    return None
+            elif not cur.execute('SELECT 1 FROM classes WHERE id = ?', (class_id,)).fetchone():
+                return None
+            before = {r['student_id']: r['status'] for r in cur.execute(
+                'SELECT student_id, status FROM attendance WHERE class_id = ?', (class_id,)
+            )}
+            for sid in student_ids:
+                cur.execute(sql, (class_id, sid, status, notes))
+            if replace:
+                if student_ids:
+                    q = (
+                        "DELETE FROM attendance WHERE class_id = ? AND status = 'present' AND student_id NOT IN (" +
+                        ",".join(["?"] * len(student_ids)) + ")"
+                    )
+                    cur.execute(q, (class_id, *student_ids))
+                else:
+                    # No students checked: clear all 'present' marks for the class
+                    cur.execute("DELETE FROM attendance WHERE class_id = ? AND status = 'present'", (class_id,))
+        return class_id, before
+
+    def enroll(self, section_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+        """Enroll a student, or put them on the waitlist when the section is full.
+        One BEGIN IMMEDIATE transaction: the capacity check and the insert are a
+        single statement against the trigger-maintained member_count, so
+        concurrent subscribes cannot overfill a section. None: no such section.
+        """
+        shard = self.storage.shard_for_section(section_id)
+        if shard is None:
+            return None
+        with self.storage.write_gate(shard), self.storage.connect(shard) as c:
+            return _enroll_locked(c, section_id, user_id)
+
+    def withdraw(self, section_id: int, user_id: int) -> List[int]:
+        """Remove a student from the section and its waitlist, then promote from
+        the head of the waitlist into the freed places. Returns promoted user ids.
+        """
+        shard = self.storage.shard_for_section(section_id)
+        if shard is None:
+            return []
+        with self.storage.write_gate(shard), self.storage.connect(shard) as c:
+            return _withdraw_locked(c, section_id, user_id)
+
+
+def _user_rules(c: sqlite3.Connection, user_id: int, first: str, last: str,
+                role: Optional[str] = None) -> List[sqlite3.Row]:
+    """Schedule rules of the user's sections whose term overlaps first..last (YYYY-MM-DD)."""
+    sql = (
+        "SELECT r.id, r.section_id, r.weekdays, r.start_time, r.location, r.starts_on, r.ends_on, r.revision, "
+        "s.name AS section "
+        "FROM section_schedules r "
+        "JOIN sections s ON s.id = r.section_id "
+        "JOIN section_members m ON m.section_id = r.section_id AND m.user_id = ? " +
+        ("AND m.role = ? " if role else "") +
+        "WHERE r.starts_on <= ? AND r.ends_on >= ?"
+    )
+    params = (user_id, role, last, first) if role else (user_id, last, first)
+    return c.execute(sql, params).fetchall()
+
+
+def _session(rule: sqlite3.Row, day: Date, role: str) -> Dict[str, Any]:
+    """A rule's session in the shape of a schedule() row."""
+    session = {
+        'id': virtual_class_id(rule['id'], day),
+        'section_id': rule['section_id'],
+        'section': rule['section'],
+        'date': f"{day.isoformat()} {rule['start_time']}:00",
+        'location': rule['location'],
+    }
+    if role == 'student':
+        session['attendance_status'] = ''
+    return session
+
+
+def _stored_session(c: sqlite3.Connection, rule_id: int, day: Date) -> Optional[int]:
+    row = c.execute(
+        'SELECT id FROM classes WHERE schedule_id = ? AND date(date) = ? ORDER BY id LIMIT 1',
+        (rule_id, day.isoformat())
+    ).fetchone()
+    return row[0] if row else None
+
+
+def _session_rule(c: sqlite3.Connection, rule_id: int, day: Date) -> Optional[sqlite3.Row]:
+    """The rule, if it has a session on `day`."""
+    rule = c.execute(
+        'SELECT id, section_id, weekdays, start_time, location, starts_on, ends_on, revision '
+        'FROM section_schedules WHERE id = ?',
+        (rule_id,)
+    ).fetchone()
+    if rule is None or day.day not in expansions.days(c, rule, day.strftime('%Y-%m')):
+        return None
+    return rule
+
+
+def _store_session(c: sqlite3.Connection, rule_id: int, day: Date) -> Optional[int]:
+    """Id of the session's classes row, inserted on first use (inside the
+    caller's write transaction). None: the rule has no session that day.
+    """
+    class_id = _stored_session(c, rule_id, day)
+    if class_id is not None:
+        return class_id
+    rule = _session_rule(c, rule_id, day)
+    if rule is None:
+        return None
+    return c.execute(
+        'INSERT INTO classes (section_id, date, location, schedule_id) VALUES (?, ?, ?, ?)',
+        (rule['section_id'], f"{day.isoformat()} {rule['start_time']}:00", rule['location'], rule_id)
+    ).lastrowid
+
+
+def _waitlist_position(c: sqlite3.Connection, section_id: int, user_id: int) -> Optional[int]:
+    row = c.execute(
+        "SELECT COUNT(1) FROM section_waitlist w "
+        "JOIN section_waitlist me ON me.section_id = w.section_id AND me.user_id = ? "
+        "WHERE w.section_id = ? AND w.id <= me.id",
+        (user_id, section_id)
+    ).fetchone()
+    return row[0] or None
+
+
+def _enroll_locked(c: sqlite3.Connection, section_id: int, user_id: int) -> Optional[Dict[str, Any]]:
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        cur = c.execute(
+            "INSERT OR IGNORE INTO section_members (section_id, user_id, role) "
+            "SELECT id, ?, 'student' FROM sections "
+            "WHERE id = ? AND (capacity IS NULL OR member_count < capacity)",
+            (user_id, section_id)
+        )
+        if cur.rowcount == 1:
+            c.commit()
+            return {"subscribed": True, "waitlist_position": None}
+        # Not inserted: unknown section, already a member, or full
+        row = c.execute(
+            "SELECT s.id, m.role FROM sections s "
+            "LEFT JOIN section_members m ON m.section_id = s.id AND m.user_id = ? "
+            "WHERE s.id = ?",
+            (user_id, section_id)
+        ).fetchone()
+        if not row:
+            c.rollback()
+            return None
+        if row['role'] is not None:
+            c.commit()
+            return {"subscribed": row['role'] == 'student', "waitlist_position": None}
+        c.execute(
+            'INSERT OR IGNORE INTO section_waitlist (section_id, user_id) VALUES (?, ?)',
+            (section_id, user_id)
+        )
+        position = _waitlist_position(c, section_id, user_id)
+        c.commit()
+        return {"subscribed": False, "waitlist_position": position}
+    except BaseException:
+        c.rollback()
+        raise
+
+
+def _withdraw_locked(c: sqlite3.Connection, section_id: int, user_id: int) -> List[int]:
+    c.execute('BEGIN IMMEDIATE')
+    try:
+        cur = c.execute(
+            "DELETE FROM section_members WHERE section_id = ? AND user_id = ? AND role = 'student'",
+            (section_id, user_id)
+        )
+        c.execute('DELETE FROM section_waitlist WHERE section_id = ? AND user_id = ?', (section_id, user_id))
+        promoted = []
+        if cur.rowcount:
+            # A place was freed: admit from the head while capacity allows
+            while True:
+                head = c.execute(
+                    "SELECT w.id, w.user_id FROM section_waitlist w "
+                    "JOIN sections s ON s.id = w.section_id "
+                    "WHERE w.section_id = ? AND (s.capacity IS NULL OR s.member_count < s.capacity) "
+                    "ORDER BY w.id LIMIT 1",
+                    (section_id,)
+                ).fetchone()
+                if not head:
+                    break
+                ins = c.execute(
+                    "INSERT OR IGNORE INTO section_members (section_id, user_id, role) VALUES (?, ?, 'student')",
+                    (section_id, head['user_id'])
+                )
+                c.execute('DELETE FROM section_waitlist WHERE id = ?', (head['id'],))
+                if ins.rowcount:
+                    promoted.append(head['user_id'])
+        c.commit()
+        return promoted
+    except BaseException:
+        c.rollback()
+        raise
+
+
+repo = SportsRepository(default_storage)
@@ -1,253 +1,211 @@
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import iterate_in_threadpool
 from typing import List, Literal, Optional
-import sqlite3
-from pathlib import Path
+from datetime import datetime
 from pydantic import BaseModel
-from .database.init import init_db, seed_db
-from .auth.security import get_current_user_optional
+from .ics import ICS_MEDIA_TYPE, check_feed_signature, feed_cache, feed_etag, feed_headers, feed_signature, not_modified, render
+from .profiling import ProfiledRoute
+from .repository import repo
+from .storage import storage
+from .writebehind import write_behind
+from .identity import get_identity, require_identity, effective_user_id, member_role
 
-DB_PATH = Path(__file__).resolve().parent / 'data' / 'sports.db'
-
-def _conn() -> sqlite3.Connection:
-    conn = sqlite3.connect(str(DB_PATH))
-    conn.row_factory = sqlite3.Row
-    return conn
-
-router = APIRouter(prefix='/api', tags=['sports'])
+# ProfiledRoute lets the slow-request capture trace handlers in their worker thread
+router = APIRouter(prefix='/api', tags=['sports'], route_class=ProfiledRoute)
 
 @router.on_event('startup')
 def _ensure_db():
-    # Initialize schema and seed once if empty
-    created = False
-    if not DB_PATH.exists():
-        init_db(db_path=str(DB_PATH), schema_path=str(Path(__file__).resolve().parent / 'database' / 'init.sql'))
-        created = True
-    # seed when created or when sections table is empty
-    with _conn() as c:
-        try:
-            cnt = c.execute('SELECT COUNT(1) FROM sections').fetchone()[0]
-        except sqlite3.OperationalError:
-            cnt = 0
-    if created or cnt == 0:
-        seed_db(db_path=str(DB_PATH), seed_path=str(Path(__file__).resolve().parent / 'database' / 'seed.sql'))
-
-def _resolve_sports_user_from_login(login: str) -> tuple[Optional[int], Optional[str]]:
-    """Resolve sports user by auth login using DB table auth_links.
-    Returns (sports_user_id, role) or (None, None) if not found.
-    """
-    key = (login or '').strip().lower()
-    if not key:
-        return None, None
-    with _conn() as c:
-        row = c.execute("SELECT sports_user_id FROM auth_links WHERE auth_login = ?", (key,)).fetchone()
-        if not row:
-            return None, None
-        user_id = int(row[0])
-        u = c.execute("SELECT role FROM users WHERE id = ?", (user_id,)).fetchone()
-        role = (u[0].lower() if u else None)
-        return user_id, role
+    # Create/migrate the schema (every shard when sharded) and seed once if empty
+    storage.ensure()
 
 @router.get('/whoami')
-def whoami(user = Depends(get_current_user_optional)):
-    # Require authentication to resolve actual sports user mapping
-    if not (user and user.get('login')):
+def whoami(identity = Depends(get_identity)):
+    # Resolved in a single join over sports.db with auth.db attached
+    if not identity or identity['sports_user_id'] is None:
         return { 'sports_user_id': None, 'role': None, 'full_name': None }
-    sport_id, role = _resolve_sports_user_from_login(user['login'])
-    with _conn() as c:
-        if sport_id is None:
-            return { 'sports_user_id': None, 'role': None, 'full_name': None }
-        row = c.execute('SELECT full_name, role FROM users WHERE id = ?', (sport_id,)).fetchone()
-        full_name = row['full_name'] if row else None
-        db_role = row['role'].lower() if row else role
-    return { 'sports_user_id': sport_id, 'role': db_role, 'full_name': full_name }
-
-def _get_user_role(conn: sqlite3.Connection, user_id: int) -> str:
-    row = conn.execute('SELECT role FROM users WHERE id = ?', (user_id,)).fetchone()
-    r = (row['role'] if row else 'student').lower()
-    return 'teacher' if r == 'teacher' else 'student'
+    return { 'sports_user_id': identity['sports_user_id'], 'role': identity['role'], 'full_name': identity['full_name'] }
 
 @router.get('/sections')
-def sections(user_id: int = Query(...)):
-    sql = (
-        "SELECT s.id, s.name, s.description FROM sections s "
-        "JOIN section_members m ON m.section_id = s.id "
-        "WHERE m.user_id = ? AND m.role = ? ORDER BY s.name"
-    )
-    with _conn() as c:
-        role = _get_user_role(c, user_id)
-        rows = c.execute(sql, (user_id, role)).fetchall()
-        return [dict(r) for r in rows]
+def sections(user_id: Optional[int] = Query(None), identity = Depends(require_identity)):
+    user_id = effective_user_id(identity, user_id)
+    return repo.user_sections(user_id, member_role(identity['role']))
 
 @router.get('/schedule')
 def schedule(
     date: str = Query(..., description='YYYY-MM-DD'),
-    user_id: int = Query(...),
+    user_id: Optional[int] = Query(None),
+    identity = Depends(require_identity),
 ):
     # normalize date to YYYY-MM-DD
     if len(date) < 10:
         raise HTTPException(status_code=400, detail='Дата должна быть в формате YYYY-MM-DD')
-    with _conn() as c:
-        role = _get_user_role(c, user_id)
-        where_member_role = role
-        if role == 'student':
-            sql = (
-                "SELECT c.id, c.section_id, s.name AS section, c.date, c.location, "
-                "IFNULL(a.status, '') AS attendance_status "
-                "FROM classes c "
-                "JOIN sections s ON s.id = c.section_id "
-                "JOIN section_members m ON m.section_id = c.section_id AND m.role = ? AND m.user_id = ? "
-                "LEFT JOIN attendance a ON a.class_id = c.id AND a.student_id = ? "
-                "WHERE date(c.date) = date(?) "
-                "ORDER BY c.date"
-            )
-            rows = c.execute(sql, (where_member_role, user_id, user_id, date)).fetchall()
-        else:
-            sql = (
-                "SELECT c.id, c.section_id, s.name AS section, c.date, c.location "
-                "FROM classes c "
-                "JOIN sections s ON s.id = c.section_id "
-                "JOIN section_members m ON m.section_id = c.section_id AND m.role = ? AND m.user_id = ? "
-                "WHERE date(c.date) = date(?) "
-                "ORDER BY c.date"
-            )
-            rows = c.execute(sql, (where_member_role, user_id, date)).fetchall()
-        return {"date": date, "role": role, "classes": [dict(r) for r in rows]}
+    user_id = effective_user_id(identity, user_id)
+    role = member_role(identity['role'])
+    return {"date": date, "role": role, "classes": repo.schedule(user_id, role, date)}
+
+def _check_month(month: str):
+    if len(month) != 7 or month[4] != '-':
+        raise HTTPException(status_code=400, detail='Месяц должен быть в формате YYYY-MM')
+
+def _bits_to_dates(month: str, bits: int) -> List[str]:
+    return [f"{month}-{d + 1:02d}" for d in range(31) if bits >> d & 1]
 
 @router.get('/attendance/dates')
 def attendance_dates(
-    user_id: int = Query(...),
+    user_id: Optional[int] = Query(None),
     month: str = Query(..., description='YYYY-MM'),
-    status: Literal['present','absent','late'] = Query('present')
+    status: Literal['present','absent','late'] = Query('present'),
+    encoding: Literal['dates','bitmap'] = Query('dates', description='bitmap: one integer, bit d-1 = day d'),
+    identity = Depends(require_identity),
 ):
     """Return distinct dates (YYYY-MM-DD) in the given month when the user has attendance with the specified status.
     Intended for student calendar highlighting.
     """
-    if len(month) != 7 or month[4] != '-':
-        raise HTTPException(status_code=400, detail='Месяц должен быть в формате YYYY-MM')
-    sql = (
-        "SELECT DISTINCT date(c.date) AS d "
-        "FROM attendance a "
-        "JOIN classes c ON c.id = a.class_id "
-        "WHERE a.student_id = ? AND a.status = ? AND strftime('%Y-%m', c.date) = ? "
-        "ORDER BY d"
-    )
-    with _conn() as c:
-        rows = c.execute(sql, (user_id, status, month)).fetchall()
-        return {"month": month, "status": status, "dates": [r["d"] for r in rows]}
+    _check_month(month)
+    user_id = effective_user_id(identity, user_id)
+    bits = repo.month_bits(user_id, month, status)
+    if encoding == 'bitmap':
+        return {"month": month, "status": status, "bitmap": bits}
+    return {"month": month, "status": status, "dates": _bits_to_dates(month, bits)}
 
 @router.get('/classes/dates')
 def classes_dates(
-    user_id: int = Query(...),
+    user_id: Optional[int] = Query(None),
     month: str = Query(..., description='YYYY-MM'),
+    encoding: Literal['dates','bitmap'] = Query('dates', description='bitmap: one integer, bit d-1 = day d'),
+    identity = Depends(require_identity),
 ):
     """Return distinct dates (YYYY-MM-DD) within the month when the user has classes
     in sections according to their role membership (student or teacher).
     """
-    if len(month) != 7 or month[4] != '-':
-        raise HTTPException(status_code=400, detail='Месяц должен быть в формате YYYY-MM')
-    with _conn() as c:
-        role = _get_user_role(c, user_id)
-        sql = (
-            "SELECT DISTINCT date(c.date) AS d "
-            "FROM classes c "
-            "JOIN section_members m ON m.section_id = c.section_id "
-            "WHERE m.user_id = ? AND m.role = ? AND strftime('%Y-%m', c.date) = ? "
-            "ORDER BY d"
-        )
-        rows = c.execute(sql, (user_id, role, month)).fetchall()
-        return {"month": month, "role": role, "dates": [r["d"] for r in rows]}
+    _check_month(month)
+    user_id = effective_user_id(identity, user_id)
+    role = member_role(identity['role'])
+    bits = repo.month_bits(user_id, month, f'scheduled_{role}')
+    if encoding == 'bitmap':
+        return {"month": month, "role": role, "bitmap": bits}
+    return {"month": month, "role": role, "dates": _bits_to_dates(month, bits)}
 
 @router.get('/classes/future-dates')
 def classes_future_dates(
-    user_id: int = Query(...),
+    user_id: Optional[int] = Query(None),
     month: str = Query(..., description='YYYY-MM'),
+    encoding: Literal['dates','bitmap'] = Query('dates', description='bitmap: one integer, bit d-1 = day d'),
+    identity = Depends(require_identity),
 ):
     """Return distinct future class dates in the given month for a student's sections.
     Used to draw an outline for upcoming classes on the calendar.
     """
-    if len(month) != 7 or month[4] != '-':
-        raise HTTPException(status_code=400, detail='Месяц должен быть в формате YYYY-MM')
-    with _conn() as c:
-        role = _get_user_role(c, user_id)
-        # Only apply to students per spec
-        if role != 'student':
-            return {"month": month, "role": role, "dates": []}
-        sql = (
-            "SELECT DISTINCT date(c.date) AS d "
-            "FROM classes c "
-            "JOIN section_members m ON m.section_id = c.section_id AND m.role = 'student' "
-            "WHERE m.user_id = ? AND strftime('%Y-%m', c.date) = ? AND datetime(c.date) >= datetime('now') "
-            "ORDER BY d"
-        )
-        rows = c.execute(sql, (user_id, month)).fetchall()
-        return {"month": month, "dates": [r["d"] for r in rows]}
+    _check_month(month)
+    user_id = effective_user_id(identity, user_id)
+    role = member_role(identity['role'])
+    # Only apply to students per spec
+    if role != 'student':
+        if encoding == 'bitmap':
+            return {"month": month, "role": role, "bitmap": 0}
+        return {"month": month, "role": role, "dates": []}
+    now = datetime.utcnow()
+    this_month = now.strftime('%Y-%m')
+    if month < this_month:
+        bits = 0
+    else:
+        bits = repo.month_bits(user_id, month, 'scheduled_student')
+        if month == this_month:
+            # Keep days after today; today only if a class is still ahead
+            today = now.day - 1
+            bits &= ~((1 << today) - 1)
+            if bits >> today & 1 and not repo.has_class_later_today(user_id, now):
+                bits &= ~(1 << today)
+    if encoding == 'bitmap':
+        return {"month": month, "bitmap": bits}
+    return {"month": month, "dates": _bits_to_dates(month, bits)}
+
+@router.get('/calendar')
+def calendar_year(
+    year: int = Query(..., ge=1970, le=9999),
+    user_id: Optional[int] = Query(None),
+    identity = Depends(require_identity),
+):
+    """All calendar bitmaps of the user for a year: {"YYYY-MM": {kind: bits}}.
+    Bit d-1 set = the user has a class (scheduled, in sections of their role) or an attendance mark of that kind on day d.
+    """
+    user_id = effective_user_id(identity, user_id)
+    return {"year": year, "months": repo.year_bits(user_id, year, member_role(identity['role']))}
+
+@router.get('/calendar/feed')
+def calendar_feed_url(request: Request, identity = Depends(require_identity)):
+    """Signed URL of the user's ICS feed, for subscribing from calendar apps (no cookie needed)."""
+    user_id = identity['sports_user_id']
+    url = request.url_for('calendar_ics', user_id=user_id).include_query_params(sig=feed_signature(user_id))
+    return {"url": str(url)}
+
+@router.get('/users/{user_id}/calendar.ics')
+def calendar_ics(user_id: int, request: Request, sig: str = Query(..., description='Signature from /api/calendar/feed')):
+    """ICS feed of the user's classes. Polls are answered from the feed version
+    alone: 304 when the client's ETag is current, otherwise the
+    cached body, and only after a change the feed is rendered again.
+    """
+    if not check_feed_signature(user_id, sig):
+        raise HTTPException(status_code=404, detail='Календарь не найден')
+    feed = repo.calendar_feed(user_id)
+    etag = feed_etag(user_id, feed.version)
+    headers = feed_headers(etag, feed.changed_at)
+    if not_modified(request.headers, etag):
+        feed.close()
+        return Response(status_code=304, headers=headers)
+    body = feed_cache.get(user_id, etag)
+    if body is not None:
+        feed.close()
+        return Response(body, media_type=ICS_MEDIA_TYPE, headers=headers)
+    chunks = feed_cache.capture(user_id, etag, render(feed.events(), feed.changed_at))
+    return StreamingResponse(_stream_feed(feed, chunks), media_type=ICS_MEDIA_TYPE, headers=headers)
+
+async def _stream_feed(feed, chunks):
+    # Rendered in the threadpool. The finally releases the shard read
+    # connections as soon as streaming ends, also when the client disconnects
+    # (cancelled here, or this generator closed by the event loop) or
+    # rendering fails, rather than whenever the abandoned render generator is
+    # collected. The render chain is closed before the connections it reads.
+    try:
+        async for chunk in iterate_in_threadpool(chunks):
+            yield chunk
+    finally:
+        try:
+            chunks.close()
+        finally:
+            feed.close()
 
 @router.get('/teacher/sections')
-def teacher_sections(user_id: int = Query(...)):
+def teacher_sections(user_id: Optional[int] = Query(None), identity = Depends(require_identity)):
     """List sections where the teacher has edit permissions."""
-    sql = (
-        "SELECT DISTINCT s.id, s.name, s.description "
-        "FROM sections s "
-    "JOIN section_permissions p ON p.section_id = s.id "
-    "WHERE p.user_id = ? AND p.permission IN ('edit_section','edit_attendance') "
-        "ORDER BY s.name"
-    )
-    with _conn() as c:
-        rows = c.execute(sql, (user_id,)).fetchall()
-        return [dict(r) for r in rows]
+    user_id = effective_user_id(identity, user_id)
+    return repo.teacher_sections(user_id)
 
-@router.get('/sections/all')
+@router.get('/sections/all', dependencies=[Depends(require_identity)])
 def sections_all():
-    with _conn() as c:
-        rows = c.execute('SELECT id, name, description FROM sections ORDER BY name').fetchall()
-        return [dict(r) for r in rows]
+    return repo.all_sections()
 
 @router.get('/sections/available')
-def sections_available(user_id: int = Query(...)):
+def sections_available(user_id: Optional[int] = Query(None), identity = Depends(require_identity)):
     """List sections where the given student is NOT currently a member as a student."""
-    sql = (
-        "SELECT s.id, s.name, s.description FROM sections s "
-        "WHERE s.id NOT IN (SELECT section_id FROM section_members WHERE user_id = ? AND role = 'student') "
-        "ORDER BY s.name"
-    )
-    with _conn() as c:
-        rows = c.execute(sql, (user_id,)).fetchall()
-        return [dict(r) for r in rows]
+    user_id = effective_user_id(identity, user_id)
+    return repo.available_sections(user_id)
 
-@router.get('/sections/{section_id}')
+@router.get('/sections/{section_id}', dependencies=[Depends(require_identity)])
 def section_detail(section_id: int):
-    with _conn() as c:
-        row = c.execute('SELECT id, name, description FROM sections WHERE id = ?', (section_id,)).fetchone()
-        if not row:
-            raise HTTPException(status_code=404, detail='Секция не найдена')
-        return dict(row)
+    section = repo.section(section_id)
+    if not section:
+        raise HTTPException(status_code=404, detail='Секция не найдена')
+    return section
 
-@router.get('/sections/{section_id}/students')
+@router.get('/sections/{section_id}/students', dependencies=[Depends(require_identity)])
 def section_students(section_id: int):
-    sql = (
-        "SELECT u.id, u.full_name, u.email "
-        "FROM section_members m "
-        "JOIN users u ON u.id = m.user_id "
-        "WHERE m.section_id = ? AND m.role = 'student' "
-        "ORDER BY u.full_name"
-    )
-    with _conn() as c:
-        rows = c.execute(sql, (section_id,)).fetchall()
-        return [dict(r) for r in rows]
+    return repo.section_students(section_id)
 
-@router.get('/classes/{class_id}/students')
+@router.get('/classes/{class_id}/students', dependencies=[Depends(require_identity)])
 def class_students(class_id: int):
-    sql = (
-        "SELECT u.id, u.full_name, u.email, IFNULL(a.status, '') AS status "
-        "FROM classes c "
-        "JOIN section_members m ON m.section_id = c.section_id AND m.role='student' "
-        "JOIN users u ON u.id = m.user_id "
-        "LEFT JOIN attendance a ON a.class_id = c.id AND a.student_id = u.id "
-        "WHERE c.id = ? ORDER BY u.full_name"
-    )
-    with _conn() as c:
-        rows = c.execute(sql, (class_id,)).fetchall()
-        return [dict(r) for r in rows]
+    return repo.class_students(class_id)
 
 class AttendanceRequest(BaseModel):
     student_ids: List[int]
@@ -256,62 +214,51 @@ class AttendanceRequest(BaseModel):
     replace: Optional[bool] = False
 
 @router.post('/classes/{class_id}/attendance')
-def set_attendance(class_id: int, payload: AttendanceRequest):
+def set_attendance(class_id: int, payload: AttendanceRequest, identity = Depends(require_identity)):
+    if identity['role'] not in ('teacher', 'admin'):
+        raise HTTPException(status_code=403, detail='Только преподаватели могут отмечать посещаемость')
     if not payload.student_ids:
         # allow empty list when replace=true to clear existing 'present' marks
         if not payload.replace:
             raise HTTPException(status_code=400, detail='Необходимо указать student_ids')
-    sql = (
-        "INSERT INTO attendance (class_id, student_id, status, notes) VALUES (?, ?, ?, ?) "
-        "ON CONFLICT(class_id, student_id) DO UPDATE SET status=excluded.status, notes=excluded.notes"
-    )
-    with _conn() as c:
-        cur = c.cursor()
-        for sid in payload.student_ids:
-            cur.execute(sql, (class_id, sid, payload.status, payload.notes))
-        # If replace mode, remove 'present' attendance for students not in the list
-        if payload.replace:
-            if payload.student_ids:
-                q = (
-                    "DELETE FROM attendance WHERE class_id = ? AND status = 'present' AND student_id NOT IN (" +
-                    ",".join(["?"] * len(payload.student_ids)) + ")"
-                )
-                cur.execute(q, (class_id, *payload.student_ids))
-            else:
-                # No students checked: clear all 'present' marks for the class
-                cur.execute("DELETE FROM attendance WHERE class_id = ? AND status = 'present'", (class_id,))
-        c.commit()
+    result = repo.set_attendance(class_id, payload.student_ids, payload.status, payload.notes, payload.replace)
+    if result is None:
+        raise HTTPException(status_code=404, detail='Занятие не найдено')
+    # A session of a schedule rule is stored now: audit and answer with its real id
+    class_id, before = result
+    now = datetime.utcnow().isoformat()
+    changed_by = identity['sports_user_id']
+    audit = [
+        (class_id, sid, before.get(sid), payload.status, payload.notes, changed_by, now)
+        for sid in dict.fromkeys(payload.student_ids)
+        if before.get(sid) != payload.status or payload.notes is not None
+    ]
+    if payload.replace:
+        kept = set(payload.student_ids)
+        audit += [
+            (class_id, sid, 'present', None, None, changed_by, now)
+            for sid, old in before.items() if old == 'present' and sid not in kept
+        ]
+    write_behind.record_audit(audit)
     return {"class_id": class_id, "updated": len(payload.student_ids), "status": payload.status, "replace": payload.replace}
 
 
 class MembershipChange(BaseModel):
-    user_id: int
+    user_id: Optional[int] = None
 
 @router.post('/sections/{section_id}/subscribe')
-def subscribe_section(section_id: int, payload: MembershipChange):
-    with _conn() as c:
-        # Ensure user is a student from users table; default to student if missing
-        role = _get_user_role(c, payload.user_id)
-        if role != 'student':
-            # Allow non-students to subscribe as students? We'll restrict per spec.
-            raise HTTPException(status_code=400, detail='Только студенты могут записываться на секции')
-        try:
-            c.execute(
-                'INSERT INTO section_members (section_id, user_id, role) VALUES (?, ?, ?)',
-                (section_id, payload.user_id, 'student')
-            )
-            c.commit()
-        except sqlite3.IntegrityError:
-            # Already a member or foreign key issue
-            pass
-    return {"section_id": section_id, "user_id": payload.user_id, "subscribed": True}
+def subscribe_section(section_id: int, payload: MembershipChange, identity = Depends(require_identity)):
+    user_id = effective_user_id(identity, payload.user_id)
+    # Role comes from the resolved identity; admins enroll as students
+    if member_role(identity['role']) != 'student':
+        raise HTTPException(status_code=400, detail='Только студенты могут записываться на секции')
+    result = repo.enroll(section_id, user_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail='Секция не найдена')
+    return {"section_id": section_id, "user_id": user_id, **result}
 
 @router.post('/sections/{section_id}/unsubscribe')
-def unsubscribe_section(section_id: int, payload: MembershipChange):
-    with _conn() as c:
-        c.execute(
-            'DELETE FROM section_members WHERE section_id = ? AND user_id = ? AND role = \"student\"',
-            (section_id, payload.user_id)
-        )
-        c.commit()
-    return {"section_id": section_id, "user_id": payload.user_id, "subscribed": False}
+def unsubscribe_section(section_id: int, payload: MembershipChange, identity = Depends(require_identity)):
+    user_id = effective_user_id(identity, payload.user_id)
+    promoted = repo.withdraw(section_id, user_id)
+    return {"section_id": section_id, "user_id": user_id, "subscribed": False, "promoted": promoted}
@@ -0,0 +1,378 @@
+import re
+import sqlite3
+import tempfile
+import threading
+import zlib
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .config import settings
+from .database.init import init_db, migrate_db, seed_db
+
+# Default global DB (and the single file when not sharded)
+SPORTS_DB_PATH = Path(__file__).resolve().parent / 'data' / 'sports.db'
+SCHEMA_PATH = Path(__file__).resolve().parent / 'database' / 'init.sql'
+SEED_PATH = Path(__file__).resolve().parent / 'database' / 'seed.sql'
+# Seconds a connection waits for the write lock (sign-up storms queue on it)
+BUSY_TIMEOUT = 30.0
+
+# Tables above the @shard marker of init.sql that import_db copies
+GLOBAL_TABLES = ('users', 'auth_links', 'attendance_audit')
+# Section-scoped tables, in the order import_db copies them (members after
+# classes so the calendar triggers see the classes)
+SHARD_TABLES = ('sections', 'section_schedules', 'classes', 'section_members', 'attendance',
+                'section_waitlist', 'section_permissions')
+# Rows created in shard i get ids from (i + 1) * ID_STRIDE, so new classes and
+# sections never collide across shards. Ids imported from a single file are kept.
+ID_STRIDE = 10 ** 9
+ROW_CACHE_SIZE = 65536
+
+_SHARD_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+
+# Set by snapshot(): one connection per file, each inside one read transaction
+_snapshot: ContextVar[Optional[Dict[str, sqlite3.Connection]]] = ContextVar('_snapshot', default=None)
+
+
+def _open(path: Path, check_same_thread: bool = True) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(path), timeout=BUSY_TIMEOUT, check_same_thread=check_same_thread)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _count_sections(conn: sqlite3.Connection) -> int:
+    try:
+        return conn.execute('SELECT COUNT(1) FROM sections').fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def _columns(conn: sqlite3.Connection, schema: str, table: str) -> List[str]:
+    return [r[1] for r in conn.execute(f'PRAGMA {schema}.table_info({table})')]
+
+
+def _copy(conn: sqlite3.Connection, table: str, where: str = '', skip: Tuple[str, ...] = ()) -> None:
+    """INSERT OR IGNORE rows of src.<table> into main.<table> (shared columns only)."""
+    theirs = set(_columns(conn, 'src', table))
+    cols = ', '.join(c for c in _columns(conn, 'main', table) if c in theirs and c not in skip)
+    if not cols:
+        # src predates the table
+        return
+    conn.execute(
+        f'INSERT OR IGNORE INTO main.{table} ({cols}) SELECT {cols} FROM src.{table}'
+        + (f' WHERE {where}' if where else '')
+    )
+
+
+def _reserve_ids(path: Path, base: int) -> None:
+    with closing(_open(path)) as conn, conn:
+        for table in SHARD_TABLES:
+            conn.execute('UPDATE sqlite_sequence SET seq = ? WHERE name = ? AND seq < ?', (base, table, base))
+            if not conn.execute('SELECT 1 FROM sqlite_sequence WHERE name = ?', (table,)).fetchone():
+                conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, base))
+
+
+class Storage(ABC):
+    """Where the sports tables live. Shards are named; `None` is the global DB
+    (users, auth_links, attendance_audit, shard catalog).
+    """
+
+    global_path: Path
+
+    @abstractmethod
+    def shards(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def shard_path(self, shard: str) -> Path:
+        ...
+
+    @abstractmethod
+    def shard_for_section(self, section_id: int) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def shard_for_class(self, class_id: int) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def shard_for_schedule(self, schedule_id: int) -> Optional[str]:
+        ...
+
+    @abstractmethod
+    def write_gate(self, shard: str) -> threading.Lock:
+        ...
+
+    @abstractmethod
+    def ensure(self) -> None:
+        ...
+
+    def paths(self) -> List[Path]:
+        return list(dict.fromkeys([self.global_path, *(self.shard_path(s) for s in self.shards())]))
+
+    def open(self, shard: Optional[str] = None, check_same_thread: bool = True) -> sqlite3.Connection:
+        """New connection to a shard (or the global DB); the caller closes it."""
+        return _open(self.global_path if shard is None else self.shard_path(shard), check_same_thread)
+
+    @contextmanager
+    def connect(self, shard: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+        """Connection to a shard (or the global DB); committed on success,
+        rolled back on error. Inside snapshot() the snapshot's connection for
+        that file is used instead.
+        """
+        path = self.global_path if shard is None else self.shard_path(shard)
+        conns = _snapshot.get()
+        if conns is None:
+            with closing(_open(path)) as conn, conn:
+                yield conn
+            return
+        conn = conns.get(str(path))
+        if conn is None:
+            conn = _open(path, check_same_thread=False)
+            # Deferred: the snapshot is taken by the first read and held to the end
+            conn.execute('BEGIN')
+            conns[str(path)] = conn
+        yield conn
+
+    @contextmanager
+    def snapshot(self) -> Iterator[None]:
+        """Reads inside share one connection per file, each in one read
+        transaction. Files are snapshotted on first use, not all at once.
+        """
+        conns: Dict[str, sqlite3.Connection] = {}
+        token = _snapshot.set(conns)
+        try:
+            yield
+        finally:
+            _snapshot.reset(token)
+            for conn in conns.values():
+                conn.rollback()
+                conn.close()
+
+
+class SingleFileStorage(Storage):
+    """Everything in one sports.db (the default)."""
+
+    SHARD = 'main'
+
+    def __init__(self, path: Path = SPORTS_DB_PATH):
+        self.global_path = Path(path)
+        # Writers in this process queue here instead of in SQLite's sleep/retry
+        # busy handler, which backs off up to 100ms per try and starves under a storm.
+        self._gate = threading.Lock()
+
+    def shards(self) -> List[str]:
+        return [self.SHARD]
+
+    def shard_path(self, shard: str) -> Path:
+        return self.global_path
+
+    def shard_for_section(self, section_id: int) -> Optional[str]:
+        return self.SHARD
+
+    def shard_for_class(self, class_id: int) -> Optional[str]:
+        return self.SHARD
+
+    def shard_for_schedule(self, schedule_id: int) -> Optional[str]:
+        return self.SHARD
+
+    def write_gate(self, shard: str) -> threading.Lock:
+        return self._gate
+
+    def ensure(self) -> None:
+        # Initialize schema and seed once if empty
+        created = False
+        if not self.global_path.exists():
+            init_db(db_path=str(self.global_path), schema_path=str(SCHEMA_PATH))
+            created = True
+        # Apply schema additions to existing DBs (idempotent)
+        migrate_db(db_path=str(self.global_path), schema_path=str(SCHEMA_PATH))
+        # seed when created or when sections table is empty
+        with self.connect() as c:
+            cnt = _count_sections(c)
+        if created or cnt == 0:
+            seed_db(db_path=str(self.global_path), seed_path=str(SEED_PATH))
+
+
+class ShardedStorage(Storage):
+    """Global tables in sports.db; sections with their classes, members,
+    waitlist, permissions, attendance and calendar bitmaps spread over shard
+    files, each with its own write lock.
+
+    The `section_shards` catalog in sports.db maps a section to its shard. A
+    class or schedule rule is found by probing the shards once and then cached. Shards must
+    keep their order in SPORTS_SHARDS (append new ones at the end): the
+    position selects the shard's id range.
+    """
+
+    def __init__(self, global_path: Path, shards: Dict[str, Path]):
+        if not shards:
+            raise ValueError('ShardedStorage needs at least one shard')
+        self.global_path = Path(global_path)
+        self._paths = dict(shards)
+        self._gates = {name: threading.Lock() for name in shards}
+        self._sections: Dict[int, str] = {}
+        self._rows: 'OrderedDict[Tuple[str, int], str]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def shards(self) -> List[str]:
+        return list(self._paths)
+
+    def shard_path(self, shard: str) -> Path:
+        return self._paths[shard]
+
+    def write_gate(self, shard: str) -> threading.Lock:
+        return self._gates[shard]
+
+    def place(self, section_id: int, faculty: Optional[str]) -> str:
+        """Shard for a section not yet in the catalog: by faculty when set,
+        so a faculty's sections share a file, otherwise by section id.
+        """
+        names = self.shards()
+        if faculty and faculty.strip():
+            return names[zlib.crc32(faculty.strip().lower().encode('utf-8')) % len(names)]
+        return names[section_id % len(names)]
+
+    def shard_for_section(self, section_id: int) -> Optional[str]:
+        shard = self._sections.get(section_id)
+        if shard is not None:
+            return shard
+        with self.connect() as g:
+            row = g.execute('SELECT shard FROM section_shards WHERE section_id = ?', (section_id,)).fetchone()
+        if row is None:
+            return None
+        if row['shard'] not in self._paths:
+            raise LookupError(f"Section {section_id} is on shard {row['shard']!r}, which is not in SPORTS_SHARDS")
+        # Sections never move while running
+        self._sections[section_id] = row['shard']
+        return row['shard']
+
+    def _probe(self, table: str, row_id: int) -> Optional[str]:
+        key = (table, row_id)
+        with self._lock:
+            shard = self._rows.get(key)
+            if shard is not None:
+                self._rows.move_to_end(key)
+                return shard
+        # Not in the catalog: one primary key probe per shard
+        for shard in self.shards():
+            with self.connect(shard) as c:
+                if c.execute(f'SELECT 1 FROM {table} WHERE id = ?', (row_id,)).fetchone():
+                    break
+        else:
+            return None
+        with self._lock:
+            self._rows[key] = shard
+            if len(self._rows) > ROW_CACHE_SIZE:
+                self._rows.popitem(last=False)
+        return shard
+
+    def shard_for_class(self, class_id: int) -> Optional[str]:
+        return self._probe('classes', class_id)
+
+    def shard_for_schedule(self, schedule_id: int) -> Optional[str]:
+        return self._probe('section_schedules', schedule_id)
+
+    def ensure(self) -> None:
+        self.global_path.parent.mkdir(parents=True, exist_ok=True)
+        migrate_db(db_path=str(self.global_path), schema_path=str(SCHEMA_PATH), part='global')
+        for i, path in enumerate(self._paths.values()):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            migrate_db(db_path=str(path), schema_path=str(SCHEMA_PATH), part='shard')
+            _reserve_ids(path, (i + 1) * ID_STRIDE)
+        with self.connect() as g:
+            cataloged = g.execute('SELECT COUNT(1) FROM section_shards').fetchone()[0]
+            legacy = _count_sections(g)
+        if cataloged:
+            return
+        if legacy:
+            # First start on a single-file sports.db: split it
+            self.import_db(self.global_path)
+            return
+        with tempfile.TemporaryDirectory() as tmp:
+            src = Path(tmp) / 'seed.db'
+            init_db(db_path=str(src), schema_path=str(SCHEMA_PATH))
+            seed_db(db_path=str(src), seed_path=str(SEED_PATH))
+            self.import_db(src)
+
+    def import_db(self, src_path: Path) -> Dict[str, int]:
+        """Copy a single-file sports.db into this layout, keeping ids.
+
+        Global tables go to sports.db (unless src is sports.db itself). Every
+        section not yet in the catalog goes to its shard together with its
+        schedule rules, classes, members, attendance, waitlist and
+        permissions; the shard
+        triggers rebuild member counts and calendar bitmaps. Sections are
+        registered in the catalog last, so an interrupted import can be rerun.
+        Returns the number of sections moved per shard.
+        """
+        src_path = Path(src_path).resolve()
+        with closing(_open(src_path)) as src:
+            cols = _columns(src, 'main', 'sections')
+            # No sections table: sports.db after util/shard_sports_db.py --drop-source
+            sections = src.execute(
+                f"SELECT id, {'faculty' if 'faculty' in cols else 'NULL'} AS faculty FROM sections ORDER BY id"
+            ).fetchall() if cols else []
+        with self.connect() as g:
+            if src_path != self.global_path.resolve():
+                g.execute('ATTACH DATABASE ? AS src', (str(src_path),))
+                for table in GLOBAL_TABLES:
+                    _copy(g, table)
+                g.commit()
+                g.execute('DETACH DATABASE src')
+            known = {r[0] for r in g.execute('SELECT section_id FROM section_shards')}
+
+        plan: Dict[str, List[int]] = {}
+        for r in sections:
+            if r['id'] not in known:
+                plan.setdefault(self.place(r['id'], r['faculty']), []).append(r['id'])
+        in_moving = 'IN (SELECT id FROM temp.moving)'
+        for shard, ids in plan.items():
+            with self.connect(shard) as c:
+                c.execute('ATTACH DATABASE ? AS src', (str(src_path),))
+                c.execute('CREATE TEMP TABLE moving (id INTEGER PRIMARY KEY)')
+                c.executemany('INSERT INTO temp.moving (id) VALUES (?)', [(i,) for i in ids])
+                # member_count starts at 0 and is counted up by the membership trigger
+                _copy(c, 'sections', f'id {in_moving}', skip=('member_count',))
+                _copy(c, 'section_schedules', f'section_id {in_moving}')
+                _copy(c, 'section_schedule_exceptions',
+                      f'schedule_id IN (SELECT id FROM src.section_schedules WHERE section_id {in_moving})')
+                _copy(c, 'classes', f'section_id {in_moving}')
+                _copy(c, 'section_members', f'section_id {in_moving}')
+                _copy(c, 'attendance', f'class_id IN (SELECT id FROM src.classes WHERE section_id {in_moving})')
+                _copy(c, 'section_waitlist', f'section_id {in_moving}')
+                _copy(c, 'section_permissions', f'section_id {in_moving}')
+                c.commit()
+                c.execute('DROP TABLE temp.moving')
+                c.execute('DETACH DATABASE src')
+        with self.connect() as g:
+            g.executemany(
+                'INSERT OR IGNORE INTO section_shards (section_id, shard) VALUES (?, ?)',
+                [(i, shard) for shard, ids in plan.items() for i in ids],
+            )
+        return {shard: len(ids) for shard, ids in plan.items()}
+
+
+def parse_shards(spec: str, base_dir: Path) -> Dict[str, Path]:
+    """SPORTS_SHARDS: `name[=path],...`; default path base_dir/sports_<name>.db."""
+    shards: Dict[str, Path] = {}
+    for item in spec.split(','):
+        name, _, path = (part.strip() for part in item.partition('='))
+        if not name and not path:
+            continue
+        if not _SHARD_NAME.match(name) or name in shards:
+            raise ValueError(f'Invalid or duplicate shard name in SPORTS_SHARDS: {name!r}')
+        file = Path(path) if path else Path(f'sports_{name}.db')
+        shards[name] = file if file.is_absolute() else base_dir / file
+    return shards
+
+
+def make_storage(spec: str, global_path: Path = SPORTS_DB_PATH) -> Storage:
+    shards = parse_shards(spec, Path(global_path).parent)
+    return ShardedStorage(global_path, shards) if shards else SingleFileStorage(global_path)
+
+
+storage = make_storage(settings.sports_shards)
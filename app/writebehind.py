@@ -0,0 +1,163 @@
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .auth.db import update_last_logins
+from .config import settings
+from .storage import storage
+
+# (class_id, student_id, old_status, new_status, notes, changed_by, changed_at)
+AuditRecord = Tuple[int, int, Optional[str], Optional[str], Optional[str], Optional[int], str]
+
+
+class WriteBehindBuffer:
+    """Buffers low-priority writes in memory and flushes them in batches.
+
+    - last-login timestamps are coalesced per user (only the newest is kept);
+    - attendance audit records are appended in order.
+
+    A background thread flushes when `flush_size` entries are pending or every
+    `flush_interval` seconds, and `stop()` flushes what is left at shutdown.
+    At most `max_pending` entries are held; beyond that new entries are
+    dropped and counted rather than growing memory.
+    """
+
+    def __init__(self, max_pending: int = 10000, flush_size: int = 500, flush_interval: float = 2.0):
+        self.max_pending = max_pending
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self._logins: Dict[int, str] = {}
+        self._audit: List[AuditRecord] = []
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+        self.counters = {
+            "logins_enqueued": 0,
+            "logins_coalesced": 0,
+            "audit_enqueued": 0,
+            "dropped": 0,
+            "logins_flushed": 0,
+            "audit_flushed": 0,
+            "flushes": 0,
+            "flush_errors": 0,
+        }
+
+    def _pending(self) -> int:
+        return len(self._logins) + len(self._audit)
+
+    def record_login(self, user_id: int, at: str) -> None:
+        with self._cond:
+            if user_id in self._logins:
+                # Folded into the pending entry: not a new row to flush
+                self._logins[user_id] = at
+                self.counters["logins_coalesced"] += 1
+                return
+            if self._pending() >= self.max_pending:
+                self.counters["dropped"] += 1
+                return
+            self._logins[user_id] = at
+            self.counters["logins_enqueued"] += 1
+            if self._pending() >= self.flush_size:
+                self._cond.notify()
+
+    def record_audit(self, records: List[AuditRecord]) -> None:
+        with self._cond:
+            room = max(0, self.max_pending - self._pending())
+            if len(records) > room:
+                self.counters["dropped"] += len(records) - room
+                records = records[:room]
+            self._audit.extend(records)
+            self.counters["audit_enqueued"] += len(records)
+            if self._pending() >= self.flush_size:
+                self._cond.notify()
+
+    def flush(self) -> None:
+        """Write everything pending, one transaction per database."""
+        with self._flush_lock:
+            with self._cond:
+                logins, self._logins = self._logins, {}
+                audit, self._audit = self._audit, []
+            if not logins and not audit:
+                return
+            try:
+                if logins:
+                    update_last_logins(list(logins.items()))
+                    self.counters["logins_flushed"] += len(logins)
+                    logins = {}
+                if audit:
+                    _insert_audit(audit)
+                    self.counters["audit_flushed"] += len(audit)
+                    audit = []
+                self.counters["flushes"] += 1
+            except Exception:
+                self.counters["flush_errors"] += 1
+                self._requeue(logins, audit)
+
+    def _requeue(self, logins: Dict[int, str], audit: List[AuditRecord]) -> None:
+        # Put unwritten entries back (newer logins win), still within the bound
+        with self._cond:
+            for user_id, at in logins.items():
+                if user_id not in self._logins:
+                    if self._pending() >= self.max_pending:
+                        self.counters["dropped"] += 1
+                        continue
+                    self._logins[user_id] = at
+            room = max(0, self.max_pending - self._pending())
+            if len(audit) > room:
+                self.counters["dropped"] += len(audit) - room
+                audit = audit[:room]
+            self._audit[:0] = audit
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._stopping and self._pending() < self.flush_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                stopping = self._stopping
+            self.flush()
+            if stopping:
+                return
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        if self._thread:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            pending_logins, pending_audit = len(self._logins), len(self._audit)
+        return {**self.counters, "pending_logins": pending_logins, "pending_audit": pending_audit}
+
+
+def _insert_audit(records: List[AuditRecord]) -> None:
+    # attendance_audit is a global table: storage.global_path in every layout
+    with storage.connect() as conn:
+        conn.executemany(
+            "INSERT INTO attendance_audit "
+            "(class_id, student_id, old_status, new_status, notes, changed_by, changed_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            records,
+        )
+
+
+write_behind = WriteBehindBuffer(
+    max_pending=settings.write_behind_max_pending,
+    flush_size=settings.write_behind_flush_size,
+    flush_interval=settings.write_behind_flush_interval,
+)
@@ -1,6 +1,20 @@
+"""
+List sections with their managing teachers.
+Usage:
+    python util/list_sections_teachers.py [path/to/sports.db]
+
+Kept for compatibility: same rows as `python util/report.py sections-with-managers`
+(shard files included), printed in this script's original format.
+"""
 import os
-import sys
 import sqlite3
+import sys
+from argparse import Namespace
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import report  # noqa: E402
 
 DEFAULT_DB_PATH = os.path.join(
     os.path.dirname(__file__),
@@ -10,61 +24,32 @@ DEFAULT_DB_PATH = os.path.join(
     "sports.db",
 )
 
-MANAGE_PERMISSIONS = ("manage_classes", "edit_section")
-
-def get_connection(db_path: str) -> sqlite3.Connection:
-    conn = sqlite3.connect(db_path)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def fetch_sections_with_managers(conn: sqlite3.Connection):
-    sql = """
-        SELECT
-            s.id,
-            s.name,
-            -- Use DISTINCT with single-arg GROUP_CONCAT (SQLite limitation) and then
-            -- replace the default comma separator with '; ' for readability.
-            COALESCE(
-                REPLACE(
-                    GROUP_CONCAT(DISTINCT u.full_name || ' <' || u.email || '>'),
-                    ',',
-                    '; '
-                ),
-                ''
-            ) AS teachers
-        FROM sections s
-        LEFT JOIN section_permissions sp
-            ON sp.section_id = s.id
-            AND sp.permission IN (?, ?)
-        LEFT JOIN users u
-            ON u.id = sp.user_id
-            AND u.role = 'teacher'
-        GROUP BY s.id, s.name
-        ORDER BY s.name;
-    """
-    return conn.execute(sql, MANAGE_PERMISSIONS).fetchall()
-
 def main():
-    db_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB_PATH
-    if not os.path.isfile(db_path):
+    db_path = Path(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_DB_PATH).resolve()
+    if not db_path.is_file():
         print(f"Database not found: {db_path}")
         sys.exit(1)
 
     try:
-        with get_connection(db_path) as conn:
-            rows = fetch_sections_with_managers(conn)
+        args = Namespace(mmap_size=report.DEFAULT_MMAP_SIZE,
+                         shard_files=report.shard_files(db_path, report.settings.sports_shards))
+    except ValueError as e:
+        print(e)
+        sys.exit(1)
+
+    found = False
+    try:
+        with report.report_rows("sections-with-managers", db_path, args) as (_, rows):
+            for section_id, name, managers in rows:
+                found = True
+                print(f"Section: {name} (id {section_id})")
+                print(f"  Managers: {managers if managers else 'None'}")
     except sqlite3.Error as e:
         print(f"SQLite error: {e}")
         sys.exit(2)
 
-    if not rows:
+    if not found:
         print("No sections found.")
-        return
-
-    for row in rows:
-        teachers = row["teachers"].strip()
-        print(f"Section: {row['name']} (id {row['id']})")
-        print(f"  Managers: {teachers if teachers else 'None'}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,164 @@
+"""
+Load test for section enrollment under a sign-up storm.
+
+Creates a scratch sports DB, adds one section with a fixed capacity, then
+fires N subscribes at once (one thread per student, released together by a
+barrier). Afterwards it checks that the section holds exactly `capacity`
+students, that member_count matches the real count, and that everyone else is
+on the waitlist in a gapless order. Finally a batch of members unsubscribes
+concurrently and promotions from the waitlist are checked.
+
+With --shards N the scratch DB is split into N shard files with one section
+each (same capacity), and students are spread over the sections round-robin:
+writes to different shards no longer queue on one lock.
+
+Usage:
+  python util/load_subscribe.py
+  python util/load_subscribe.py --students 1000 --capacity 120 --leavers 40
+  python util/load_subscribe.py --shards 4 --students 4000
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.database.init import init_db, migrate_db  # noqa: E402
+from app.repository import SportsRepository  # noqa: E402
+from app.storage import BUSY_TIMEOUT, ShardedStorage, SingleFileStorage, Storage  # noqa: E402
+
+
+def _connect(db_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(str(db_path), timeout=BUSY_TIMEOUT)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _storm(user_ids: List[int], op: Callable[[int], object]) -> List[float]:
+    """Run op for every user at once; returns completion times (seconds from start)."""
+    barrier = threading.Barrier(len(user_ids) + 1)
+    done: List[float] = []
+    errors: List[BaseException] = []
+    lock = threading.Lock()
+    started = [0.0]
+
+    def worker(uid: int) -> None:
+        try:
+            barrier.wait()
+            op(uid)
+            with lock:
+                done.append(time.perf_counter() - started[0])
+        except BaseException as e:  # reported below
+            with lock:
+                errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(uid,)) for uid in user_ids]
+    for t in threads:
+        t.start()
+    started[0] = time.perf_counter()
+    barrier.wait()
+    for t in threads:
+        t.join()
+    if errors:
+        raise RuntimeError(f"{len(errors)} operations failed, first: {errors[0]!r}")
+    return sorted(done)
+
+
+def _report(name: str, times: List[float], buckets: int = 5) -> None:
+    total = times[-1]
+    print(f"{name}: {len(times)} ops in {total:.2f}s ({len(times) / total:.0f} ops/s)")
+    # Throughput per slice of completions: should stay flat, not collapse
+    step = max(1, len(times) // buckets)
+    prev = 0.0
+    for i in range(step - 1, len(times), step):
+        span = times[i] - prev
+        print(f"  ops {i - step + 2:>5}-{i + 1:<5} {step / span if span else float('inf'):8.0f} ops/s")
+        prev = times[i]
+
+
+def _section_state(storage: Storage, section_id: int):
+    shard = storage.shard_for_section(section_id)
+    with storage.connect(shard) as c:
+        members = [r[0] for r in c.execute("SELECT user_id FROM section_members WHERE section_id = ? ORDER BY id", (section_id,))]
+        counter = c.execute("SELECT member_count FROM sections WHERE id = ?", (section_id,)).fetchone()[0]
+        waitlist = [r[0] for r in c.execute("SELECT user_id FROM section_waitlist WHERE section_id = ? ORDER BY id", (section_id,))]
+    return members, counter, waitlist
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Concurrent subscribe/unsubscribe load test")
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--capacity", type=int, default=100, help="Capacity of each section")
+    parser.add_argument("--leavers", type=int, default=25, help="Members per section who unsubscribe afterwards")
+    parser.add_argument("--shards", type=int, default=0, help="Split into N shard files, one section each (0: single file)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "sports.db"
+        n_sections = max(1, args.shards)
+        init_db(db_path=str(db_path), schema_path="init.sql")
+        migrate_db(db_path=str(db_path), schema_path="init.sql")
+        with _connect(db_path) as c:
+            c.executemany(
+                "INSERT INTO sections (id, name, capacity, faculty) VALUES (?, ?, ?, ?)",
+                [(s, f"Секция {s}", args.capacity, f"faculty-{s}") for s in range(1, n_sections + 1)],
+            )
+            c.executemany(
+                "INSERT INTO users (id, full_name, email, role) VALUES (?, ?, ?, 'student')",
+                [(i, f"Student {i}", f"s{i}@example.com") for i in range(1, args.students + 1)],
+            )
+            c.commit()
+        storage: Storage = SingleFileStorage(db_path)
+        if args.shards:
+            sharded = ShardedStorage(db_path, {f"s{i}": Path(tmp) / f"sports_s{i}.db" for i in range(args.shards)})
+            sharded.ensure()
+            # Pin section i to shard i instead of hashing faculties
+            sharded.place = lambda section_id, faculty: f"s{(section_id - 1) % args.shards}"  # type: ignore[method-assign]
+            sharded.import_db(db_path)
+            storage = sharded
+        repo = SportsRepository(storage)
+
+        def section_of(uid: int) -> int:
+            return (uid - 1) % n_sections + 1
+
+        students = list(range(1, args.students + 1))
+        _report("subscribe", _storm(students, lambda uid: repo.enroll(section_of(uid), uid)))
+
+        before: Dict[int, tuple] = {}
+        for section_id in range(1, n_sections + 1):
+            members, counter, waitlist = _section_state(storage, section_id)
+            applicants = len([u for u in students if section_of(u) == section_id])
+            expected_members = min(args.capacity, applicants)
+            assert len(members) == expected_members, (section_id, len(members), expected_members)
+            assert counter == len(members), (section_id, counter, len(members))
+            assert len(waitlist) == applicants - expected_members, (section_id, len(waitlist))
+            assert not set(members) & set(waitlist)
+            before[section_id] = (members, waitlist)
+            print(f"  section {section_id}: members={len(members)} member_count={counter} waitlist={len(waitlist)}  OK")
+
+        leavers = [u for members, _ in before.values() for u in members[:args.leavers]]
+        _report("unsubscribe", _storm(leavers, lambda uid: repo.withdraw(section_of(uid), uid)))
+        for section_id, (members, waitlist) in before.items():
+            members_after, counter, waitlist_after = _section_state(storage, section_id)
+            left = len(members[:args.leavers])
+            promoted = min(left, len(waitlist))
+            assert len(members_after) == len(members) - left + promoted, (section_id, len(members_after))
+            assert counter == len(members_after), (section_id, counter, len(members_after))
+            # The earliest waiters were promoted, in order
+            assert set(waitlist[:promoted]) <= set(members_after)
+            assert waitlist_after == waitlist[promoted:]
+            print(f"  section {section_id}: members={len(members_after)} member_count={counter} "
+                  f"waitlist={len(waitlist_after)} promoted={promoted}  OK")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+r"""
+Read-only reports over the sports SQLite DB.
+
+Rows are streamed from the cursor and written as they arrive (nothing is
+collected with fetchall), so exports of the full-size DB run in constant
+memory. The DB is opened with mode=ro, query_only and a large mmap_size.
+
+Reports:
+  users                  all users
+  sections-with-managers one row per section with its managing teachers
+  attendance-summary     present/absent/late counts per student and section
+  roster                 section members (use --section to limit to one)
+
+Usage:
+  python util/report.py users
+  python util/report.py roster --section 1 --format csv
+  python util/report.py users roster attendance-summary --format jsonl --out-dir exports/
+
+Several reports given at once run concurrently, each on its own read
+connection, and each is written to <out-dir>/<report>.<ext>.
+
+After a split into shards (util/shard_sports_db.py, SPORTS_SHARDS) the
+section reports run on every shard file, with sports.db attached for users,
+and the streams are merged in section order. Shard paths come from --shards
+(default: SPORTS_SHARDS); every shard named in the section_shards catalog
+must be configured.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import heapq
+import itertools
+import json
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.config import settings  # noqa: E402
+from app.storage import parse_shards  # noqa: E402
+
+DEFAULT_MMAP_SIZE = 1 << 30  # 1 GiB; SQLite caps it at the file size
+MANAGE_PERMISSIONS = ("manage_classes", "edit_section")
+
+Rows = Tuple[List[str], Iterator[tuple]]
+
+
+def connect_readonly(db_path: Path, mmap_size: int = DEFAULT_MMAP_SIZE) -> sqlite3.Connection:
+    conn = sqlite3.connect(f"file:{db_path.as_posix()}?mode=ro", uri=True, check_same_thread=False)
+    conn.execute(f"PRAGMA mmap_size = {int(mmap_size)}")
+    conn.execute("PRAGMA query_only = 1")
+    return conn
+
+
+def _stream(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> Rows:
+    cur = conn.execute(sql, params)
+    return [d[0] for d in cur.description], iter(cur)
+
+
+def report_users(conn: sqlite3.Connection, args: argparse.Namespace) -> Rows:
+    return _stream(conn, "SELECT * FROM users ORDER BY id")
+
+
+def report_sections_with_managers(conn: sqlite3.Connection, args: argparse.Namespace) -> Rows:
+    # One row per (section, manager) in section order; managers are folded per
+    # section while streaming instead of building GROUP_CONCAT strings in SQL.
+    sql = """
+        SELECT DISTINCT s.id, s.name, u.full_name, u.email
+        FROM sections s
+        LEFT JOIN section_permissions sp
+            ON sp.section_id = s.id
+            AND sp.permission IN (?, ?)
+        LEFT JOIN users u
+            ON u.id = sp.user_id
+            AND u.role = 'teacher'
+        ORDER BY s.name, s.id, u.full_name
+    """
+    cur = conn.execute(sql, MANAGE_PERMISSIONS)
+
+    def rows() -> Iterator[tuple]:
+        for (section_id, name), group in itertools.groupby(cur, key=lambda r: (r[0], r[1])):
+            managers = "; ".join(f"{r[2]} <{r[3]}>" for r in group if r[2] is not None)
+            yield section_id, name, managers
+
+    return ["id", "name", "managers"], rows()
+
+
+def report_attendance_summary(conn: sqlite3.Connection, args: argparse.Namespace) -> Rows:
+    sql = """
+        SELECT s.id AS section_id, s.name AS section, u.id AS student_id, u.full_name,
+               SUM(a.status = 'present') AS present,
+               SUM(a.status = 'absent') AS absent,
+               SUM(a.status = 'late') AS late
+        FROM attendance a
+        JOIN classes c ON c.id = a.class_id
+        JOIN sections s ON s.id = c.section_id
+        JOIN users u ON u.id = a.student_id
+        GROUP BY s.id, u.id
+        ORDER BY s.name, u.full_name
+    """
+    return _stream(conn, sql)
+
+
+def report_roster(conn: sqlite3.Connection, args: argparse.Namespace) -> Rows:
+    sql = (
+        "SELECT s.id AS section_id, s.name AS section, m.role, u.id AS user_id, u.full_name, u.email "
+        "FROM section_members m "
+        "JOIN sections s ON s.id = m.section_id "
+        "JOIN users u ON u.id = m.user_id "
+    )
+    if args.section is not None:
+        return _stream(conn, sql + "WHERE m.section_id = ? ORDER BY m.role DESC, u.full_name", (args.section,))
+    return _stream(conn, sql + "ORDER BY s.name, m.role DESC, u.full_name")
+
+
+REPORTS: Dict[str, Callable[[sqlite3.Connection, argparse.Namespace], Rows]] = {
+    "users": report_users,
+    "sections-with-managers": report_sections_with_managers,
+    "attendance-summary": report_attendance_summary,
+    "roster": report_roster,
+}
+EXTENSIONS = {"table": "txt", "csv": "csv", "jsonl": "jsonl"}
+# Reports over section-scoped tables, with their merge key over shards. A
+# section lives in one shard, so merging on the section name (unique) keeps
+# each shard's own order within a section.
+SECTION_REPORTS: Dict[str, Callable[[tuple], tuple]] = {
+    "sections-with-managers": lambda row: (row[1],),
+    "attendance-summary": lambda row: (row[1],),
+    "roster": lambda row: (row[1],),
+}
+
+
+def shard_files(db_path: Path, spec: str) -> List[Path]:
+    """Shard files of a split sports.db in catalog order; [] for a single file.
+    Raises ValueError when the catalog names a shard `spec` does not configure.
+    """
+    conn = connect_readonly(db_path)
+    try:
+        names = [r[0] for r in conn.execute("SELECT DISTINCT shard FROM section_shards ORDER BY shard")]
+    except sqlite3.OperationalError:
+        # No catalog: a DB from before sharding
+        names = []
+    finally:
+        conn.close()
+    if not names:
+        return []
+    shards = parse_shards(spec, db_path.parent)
+    missing = [name for name in names if name not in shards]
+    if missing:
+        raise ValueError(
+            f"{db_path} is split into shards ({', '.join(names)}); "
+            f"--shards / SPORTS_SHARDS does not configure: {', '.join(missing)}"
+        )
+    return [shards[name] for name in names]
+
+
+def write_rows(out: TextIO, fmt: str, cols: List[str], rows: Iterable[tuple]) -> int:
+    """Write rows as they are produced; returns the row count."""
+    n = 0
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(cols)
+        for row in rows:
+            writer.writerow(row)
+            n += 1
+    elif fmt == "jsonl":
+        for row in rows:
+            out.write(json.dumps(dict(zip(cols, row)), ensure_ascii=False))
+            out.write("\n")
+            n += 1
+    else:
+        header = " | ".join(cols)
+        out.write(header + "\n")
+        out.write("-" * (len(header) + 2) + "\n")
+        for row in rows:
+            out.write(" | ".join(str(v) if v is not None else "" for v in row) + "\n")
+            n += 1
+    return n
+
+
+@contextmanager
+def report_rows(name: str, db_path: Path, args: argparse.Namespace) -> Iterator[Rows]:
+    """(columns, rows) of a report, merged across shard files for section
+    reports; the read connections are closed on exit. `args` needs
+    mmap_size and shard_files, plus the report's own options.
+    """
+    shards = args.shard_files if name in SECTION_REPORTS else []
+    if not shards:
+        conn = connect_readonly(db_path, args.mmap_size)
+        try:
+            yield REPORTS[name](conn, args)
+        finally:
+            conn.close()
+        return
+    conns: List[sqlite3.Connection] = []
+    try:
+        streams = []
+        for path in shards:
+            conn = connect_readonly(path, args.mmap_size)
+            conns.append(conn)
+            # Shard files have no users table: it resolves to sports.db
+            conn.execute("ATTACH DATABASE ? AS global_db", (f"file:{db_path.as_posix()}?mode=ro",))
+            cols, rows = REPORTS[name](conn, args)
+            streams.append(rows)
+        yield cols, heapq.merge(*streams, key=SECTION_REPORTS[name])
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+def run_report(name: str, db_path: Path, args: argparse.Namespace, out: TextIO) -> int:
+    with report_rows(name, db_path, args) as (cols, rows):
+        return write_rows(out, args.format, cols, rows)
+
+
+def _run_to_file(name: str, db_path: Path, args: argparse.Namespace, out_dir: Path) -> Tuple[str, int, float, Path]:
+    started = time.perf_counter()
+    path = out_dir / f"{name}.{EXTENSIONS[args.format]}"
+    with path.open("w", encoding="utf-8", newline="") as out:
+        n = run_report(name, db_path, args, out)
+    return name, n, time.perf_counter() - started, path
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    repo_root = Path(__file__).resolve().parents[1]
+    default_db = repo_root / "app" / "data" / "sports.db"
+
+    parser = argparse.ArgumentParser(description="Read-only reports over sports.db")
+    parser.add_argument("reports", nargs="+", choices=sorted(REPORTS), metavar="report",
+                        help=f"One or more of: {', '.join(sorted(REPORTS))}")
+    parser.add_argument("--db", type=Path, default=default_db, help=f"Path to sports.db (default: {default_db})")
+    parser.add_argument("--format", choices=sorted(EXTENSIONS), default="table", help="Output format (default: table)")
+    parser.add_argument("--out-dir", type=Path, help="Write each report to <out-dir>/<report>.<ext>; required for several reports")
+    parser.add_argument("--section", type=int, help="roster: only this section id")
+    parser.add_argument("--mmap-size", type=int, default=DEFAULT_MMAP_SIZE, help="PRAGMA mmap_size in bytes")
+    parser.add_argument("--jobs", type=int, default=4, help="Reports run concurrently (default: 4)")
+    parser.add_argument("--shards", default=settings.sports_shards,
+                        help="Shards of a split sports.db, as in SPORTS_SHARDS: name[=path],... (default: SPORTS_SHARDS)")
+    args = parser.parse_args(argv)
+
+    # Relative to the current directory, like the util/list_users.py --db it replaces
+    db_path: Path = args.db.resolve()
+    if not db_path.exists():
+        print(f"Database not found: {db_path}", file=sys.stderr)
+        return 1
+    try:
+        args.shard_files = shard_files(db_path, args.shards)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 1
+    reports = list(dict.fromkeys(args.reports))
+    if len(reports) > 1 and not args.out_dir:
+        parser.error("--out-dir is required when running several reports")
+
+    try:
+        if not args.out_dir:
+            run_report(reports[0], db_path, args, sys.stdout)
+            return 0
+        args.out_dir.mkdir(parents=True, exist_ok=True)
+        # sqlite3 releases the GIL while stepping, so separate read
+        # connections make progress in parallel.
+        with ThreadPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+            futures = [pool.submit(_run_to_file, name, db_path, args, args.out_dir) for name in reports]
+            for fut in futures:
+                name, n, elapsed, path = fut.result()
+                print(f"{name}: {n} rows in {elapsed:.2f}s -> {path}", file=sys.stderr)
+    except sqlite3.Error as e:
+        print(f"SQLite error: {e}", file=sys.stderr)
+        return 2
+    except BrokenPipeError:
+        # e.g. piped into `head`
+        return 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -20,8 +20,13 @@ from __future__ import annotations
 
 import argparse
 import sqlite3
+import sys
 from pathlib import Path
 
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.database.init import migrate_db  # noqa: E402
+
 
 def run_sql_script(db_path: Path, sql_path: Path) -> None:
     if not sql_path.is_file():
@@ -58,7 +63,9 @@ def main() -> int:
     if not args.skip_schema:
         print(f"Schema: {schema_path}")
         print("Applying schema...")
-        run_sql_script(db_path, schema_path)
+        # migrate_db also adds columns introduced after the DB was created
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        migrate_db(db_path=str(db_path), schema_path=str(schema_path))
     else:
         print("Skipping schema application (per flag)")
 
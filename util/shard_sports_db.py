@@ -0,0 +1,86 @@
+"""
+Split a single-file sports.db into shard files.
+
+Sections are placed by faculty (sections.faculty) when it is set, otherwise by
+section id, and each moves with its schedule rules, classes, members,
+waitlist, permissions and attendance; ids are kept. sports.db keeps users, auth_links,
+attendance_audit and gains the section_shards catalog. Sections already in
+the catalog are skipped, so the script can be rerun (e.g. after adding a
+shard, to place newly added sections).
+
+The app does the same on its first start with SPORTS_SHARDS set; this script
+does it offline and can drop the moved tables from sports.db afterwards.
+
+Usage:
+  python util/shard_sports_db.py --shards eng,science,humanities
+  python util/shard_sports_db.py --shards "eng,science=/mnt/disk2/sports_science.db" --drop-source
+"""
+
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app.storage import SHARD_TABLES, ShardedStorage, parse_shards  # noqa: E402
+
+
+def drop_source_tables(db_path: Path) -> None:
+    conn = sqlite3.connect(str(db_path))
+    try:
+        # The view and the triggers (dropped with their tables) reference these
+        conn.execute("DROP VIEW IF EXISTS calendar_days")
+        for table in (*SHARD_TABLES, "section_schedule_exceptions", "calendar_bits"):
+            conn.execute(f"DROP TABLE IF EXISTS {table}")
+        conn.commit()
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+def main() -> int:
+    repo_root = Path(__file__).resolve().parents[1]
+    default_db = repo_root / "app" / "data" / "sports.db"
+
+    parser = argparse.ArgumentParser(description="Split sports.db into shard files")
+    parser.add_argument("--db", type=Path, default=default_db, help=f"Path to sports.db (default: {default_db})")
+    parser.add_argument("--shards", required=True, help="Same format as SPORTS_SHARDS: name[=path],...")
+    parser.add_argument("--drop-source", action="store_true",
+                        help="Drop the moved tables from sports.db once the catalog is complete")
+    args = parser.parse_args()
+
+    db_path: Path = args.db if args.db.is_absolute() else (repo_root / args.db)
+    if not db_path.exists():
+        print(f"Database not found: {db_path}", file=sys.stderr)
+        return 1
+    shards = parse_shards(args.shards, db_path.parent)
+    if not shards:
+        parser.error("--shards is empty")
+
+    storage = ShardedStorage(db_path, shards)
+    # Creates the shard files and the catalog; a sports.db without a catalog is split here
+    storage.ensure()
+    moved = storage.import_db(db_path)
+    with storage.connect() as g:
+        per_shard = dict(g.execute("SELECT shard, COUNT(1) FROM section_shards GROUP BY shard").fetchall())
+        try:
+            total = g.execute("SELECT COUNT(1) FROM sections").fetchone()[0]
+        except sqlite3.OperationalError:
+            total = None
+    for name, path in shards.items():
+        print(f"{name}: {per_shard.get(name, 0)} sections ({moved.get(name, 0)} moved now) -> {path}")
+
+    if args.drop_source:
+        if total is not None and total > sum(per_shard.values()):
+            print("Not dropping: some sections of sports.db are not in the catalog", file=sys.stderr)
+            return 2
+        drop_source_tables(db_path)
+        print(f"Dropped section tables from {db_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())